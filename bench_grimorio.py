@@ -0,0 +1,456 @@
+# bench_grimorio.py — benchmark offline dos comandos do Grimório
+# Roda cmd_magia / cmd_buscar / cmd_listar / autocomplete_magias contra uma
+# Interaction falsa (sem Discord) e um servidor HTTP local no lugar das páginas
+# de mídia (Tenor / og:image). Mede p50/p99 e vazão com N chamadas simultâneas,
+# em grimórios sintéticos de 133 a 100k magias, e grava tudo num JSON.
+#
+# Uso:
+#   python bench_grimorio.py
+#   python bench_grimorio.py --sizes 133,10000 --concurrency 1,32 --requests 1000
+#   python bench_grimorio.py --commands magia --media-cache off --stub-delay 80
+#   python bench_grimorio.py --commands autocomplete --autocomplete-len 1-2 --autocomplete-infix 1 --sizes 133,10000,100000
+#     (autocomplete com 1-2 letras do meio do título: o pior caso do índice de títulos)
+#   python bench_grimorio.py --cold-start --commands "" --sizes 133,10000,100000
+#     (partida a frio: processo novo até o grimório pronto, sem e com o snapshot binário)
+#
+# Compare dois JSON (versões diferentes do bot) pelos campos p50_ms/p99_ms/throughput.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+# o bench não deve sujar o diretório do bot com caches em disco
+# (o cache de mídia só vai para o disco com --media-cache-file)
+os.environ.setdefault("SNAPSHOT_CACHE_FILE", "")
+
+from aiohttp import web
+
+import bot_grimorio as grimorio
+
+COMMANDS = ("magia", "buscar", "listar", "autocomplete")
+DEFAULT_SIZES = "133,1000,10000,100000"
+DEFAULT_CONCURRENCY = "1,8,32"
+
+# -------------------------
+# Interaction falsa (só o que os comandos usam)
+# -------------------------
+class FakeUser:
+    __slots__ = ("id",)
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+class FakeFollowup:
+    """Guarda os envios; `latency` simula o tempo de ida e volta da API REST do Discord."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+class FakeResponse:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.done = False
+
+    async def _call(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.done = True
+
+    async def defer(self, **kwargs):
+        await self._call()
+
+    async def send_message(self, content=None, **kwargs):
+        await self._call()
+
+    async def edit_message(self, **kwargs):
+        await self._call()
+
+    def is_done(self) -> bool:
+        return self.done
+
+class FakeInteraction:
+    guild = None
+    guild_id = None
+
+    def __init__(self, user_id: int, latency: float = 0.0):
+        self.user = FakeUser(user_id)
+        self.response = FakeResponse(latency)
+        self.followup = FakeFollowup(latency)
+
+# -------------------------
+# Servidor HTTP local (páginas de mídia)
+# - /page/<id> responde HTML com og:image (como o Tenor)
+# - /img/<id>.gif é mídia direta (o bot nem baixa)
+# -------------------------
+class MediaStub:
+    def __init__(self, delay: float = 0.05, fail_rate: float = 0.0):
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.port = 0
+        self.requests = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _page(self, request: web.Request):
+        self.requests += 1
+        page_id = request.match_info["page_id"]
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        # falhas determinísticas: o mesmo id sempre falha (entre execuções também)
+        if self.fail_rate and (zlib.crc32(page_id.encode()) % 1000) < self.fail_rate * 1000:
+            return web.Response(status=404, text="not found")
+        html = (f'<html><head><meta property="og:image" content="{self.base_url}/img/{page_id}.gif">'
+                f"</head><body>{'x' * 2048}</body></html>")
+        return web.Response(text=html, content_type="text/html")
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/page/{page_id}", self._page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _run(self):
+        # loop próprio numa thread: o servidor não disputa o loop dos comandos medidos
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._start())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+# -------------------------
+# Grimório sintético
+# - as primeiras magias são as do grimorio_completo.json; depois títulos
+#   aleatórios com as palavras reais e descrições/categorias reaproveitadas
+# - urls de imagem apontam para o MediaStub
+# -------------------------
+_URL_RE = re.compile(r'https?://[^\s\'"<>]+')
+
+def load_base_spells(path: str) -> List[dict]:
+    base = [m for m in grimorio.iter_spell_objects(path) if isinstance(m, dict) and m.get("title")]
+    if not base:
+        raise SystemExit(f"❌ Nenhuma magia em {path}")
+    return base
+
+def synth_spells(base: List[dict], n: int, stub_url: str, image_ratio: float, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    words = sorted({w for m in base for w in str(m["title"]).split() if len(w) > 2})
+    out = []
+    for i in range(n):
+        src = base[i % len(base)]
+        title = src["title"] if i < len(base) else " ".join(rng.sample(words, 3))
+        k = 0
+
+        def swap(match):
+            nonlocal k
+            k += 1
+            if grimorio.is_direct_media(match.group(0)):
+                return f"{stub_url}/img/{i}-{k}.gif"
+            return f"{stub_url}/page/{i}-{k}"
+
+        desc = _URL_RE.sub(swap, str(src.get("description") or ""))
+        if rng.random() < image_ratio:
+            desc += f'\n<img src="{stub_url}/page/{i}-x">'
+        out.append({
+            "title": title,
+            "description": desc,
+            "categories": list(src.get("categories") or []),
+            "element": src.get("element") or "",
+        })
+    return out
+
+def write_grimorio(spells: List[dict], directory: str, n: int) -> str:
+    path = os.path.join(directory, f"grimorio_{n}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(spells, f, ensure_ascii=False)
+    return path
+
+# -------------------------
+# Partida a frio
+# - um processo novo por medida: import + carga do grimório, como no start_bot
+# - primeira rodada sem snapshot binário (monta do JSON e grava o cache),
+#   segunda com o cache recém-gravado
+# -------------------------
+COLD_START_CHILD = (
+    "import json, time\n"
+    "import bot_grimorio as g\n"
+    "imported = time.perf_counter() - g._IMPORT_STARTED\n"
+    "t0 = time.perf_counter()\n"
+    "snap = g.load_spells(g.JSON_FILE)\n"
+    "print('COLD ' + json.dumps({'import_s': imported, 'dataset_s': time.perf_counter() - t0,\n"
+    "                            'spells': len(snap.magias) if snap else 0}), flush=True)\n"
+)
+
+def cold_start(path: str, directory: str, n: int) -> List[dict]:
+    """Tempo do lançamento do processo até o grimório pronto (cache "miss" e depois "hit")."""
+    cache = os.path.join(directory, f"snapshot_{n}.pickle")
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(cache)
+    env = dict(os.environ, GRIMORIO_FILE=path, SNAPSHOT_CACHE_FILE=cache, KEEPALIVE="0",
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    out = []
+    for run in ("miss", "hit"):
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-c", COLD_START_CHILD], env=env, cwd=directory,
+                                stdout=subprocess.PIPE, text=True, encoding="utf-8")
+        info = None
+        for line in proc.stdout:
+            if line.startswith("COLD "):
+                ready = time.perf_counter() - t0
+                info = json.loads(line[5:])
+        proc.wait()
+        if info is None or not info["spells"]:
+            raise SystemExit(f"❌ Partida a frio falhou ({n} magias, cache {run}, código {proc.returncode})")
+        r = {"size": n, "snapshot_cache": run, "ready_s": round(ready, 4),
+             "import_s": round(info["import_s"], 4), "dataset_s": round(info["dataset_s"], 4)}
+        out.append(r)
+        print(f"  partida a frio, cache {run:<4}: pronto em {r['ready_s']:.3f} s "
+              f"(import {r['import_s']:.3f} s, grimório {r['dataset_s']:.3f} s)")
+    return out
+
+# -------------------------
+# Consultas (determinísticas pela seed)
+# -------------------------
+def _typo(rng: random.Random, s: str) -> str:
+    if len(s) < 4:
+        return s + "x"
+    k = rng.randrange(len(s))
+    return s[:k] + s[k + 1:]
+
+def build_queries(snap: "grimorio.GrimorioSnapshot", command: str, count: int, seed: int, hot_set: int = 0,
+                  ac_len: Tuple[int, int] = (1, 6), ac_infix: float = 0.0) -> List[str]:
+    """Consultas do cenário; com hot_set > 0 só as hot_set primeiras distintas se repetem (tráfego "popular")."""
+    queries = _queries(snap, command, count, seed, ac_len, ac_infix)
+    if hot_set > 0:
+        rng = random.Random(seed + 1)
+        pool = list(dict.fromkeys(queries))[:hot_set]
+        queries = [rng.choice(pool) for _ in range(count)]
+    return queries
+
+def _queries(snap: "grimorio.GrimorioSnapshot", command: str, count: int, seed: int,
+             ac_len: Tuple[int, int] = (1, 6), ac_infix: float = 0.0) -> List[str]:
+    rng = random.Random(seed)
+    titles = [m.title for m in snap.magias]
+    if command == "magia":
+        # ~10% com erro de digitação: passa pelo "Você quis dizer"
+        return [_typo(rng, t) if rng.random() < 0.1 else t for t in rng.choices(titles, k=count)]
+    if command == "autocomplete":
+        # começo do título; com ac_infix > 0, essa fração sai de uma posição qualquer do título
+        out = []
+        for t in rng.choices(titles, k=count):
+            n = rng.randint(*ac_len)
+            k = rng.randrange(max(1, len(t) - n + 1)) if ac_infix and rng.random() < ac_infix else 0
+            out.append(t[k:k + n])
+        return out
+    elementos = sorted(grimorio.ELEMENTOS_BUSCA)
+    categorias = sorted({c for m in snap.magias for c in m.categories}) or ["suprema"]
+    if command == "listar":
+        pool = elementos + categorias + ["todas"]
+        return rng.choices(pool, k=count)
+    palavras = sorted({w for t in titles[:2000] for w in t.split() if len(w) > 3}) or ["fogo"]
+    return [rng.choice(elementos) if rng.random() < 0.3 else rng.choice(palavras) for _ in range(count)]
+
+def handler_for(command: str):
+    """Função por trás do comando, sem o limite de taxa (mantém o @instrumented)."""
+    if command == "autocomplete":
+        return grimorio.autocomplete_magias
+    cmd = {"magia": grimorio.cmd_magia, "buscar": grimorio.cmd_buscar, "listar": grimorio.cmd_listar}[command]
+    return getattr(cmd.callback, "__wrapped__", cmd.callback)
+
+# -------------------------
+# Execução
+# -------------------------
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+async def run_scenario(command: str, queries: List[str], concurrency: int, send_latency: float) -> dict:
+    handler = handler_for(command)
+    latencies: List[float] = []
+    errors = 0
+    next_query = 0
+
+    async def worker(worker_id: int):
+        nonlocal next_query, errors
+        while next_query < len(queries):
+            q = queries[next_query]
+            next_query += 1
+            interaction = FakeInteraction(worker_id, send_latency)
+            t0 = time.perf_counter()
+            try:
+                await handler(interaction, q)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(k + 1) for k in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    ms = [x * 1000 for x in latencies]
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(ms) / len(ms), 4) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p90_ms": round(percentile(ms, 90), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+        "max_ms": round(ms[-1], 4) if ms else 0.0,
+    }
+
+def reset_media_cache(mode: str, path: str = ""):
+    # "warm": cache vazio no começo de cada cenário; "off": toda /magia vai ao stub
+    # path: também grava no SQLite (mede o custo da escrita em disco); o arquivo é zerado por cenário
+    grimorio.media_cache.close()
+    if path:
+        for suffix in ("", "-wal", "-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path + suffix)
+    grimorio.media_cache = grimorio.MediaCache(path, max_entries=0 if mode == "off" else grimorio.MEDIA_CACHE_MAX)
+
+def reset_response_cache(mode: str):
+    # cada cenário começa sem respostas nem páginas do cenário anterior; "off": nada fica guardado
+    grimorio.RESPONSE_CACHE.clear()
+    grimorio.RESPONSE_CACHE.max_entries = 0 if mode == "off" else grimorio.RESPONSE_CACHE_MAX
+    grimorio.PAGE_STORE.clear()
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+def _int_list(raw: str) -> List[int]:
+    return [int(x) for x in raw.split(",") if x.strip()]
+
+def _int_range(raw: str) -> Tuple[int, int]:
+    lo, _, hi = raw.partition("-")
+    return int(lo), int(hi or lo)
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark offline dos comandos do Grimório.")
+    p.add_argument("--sizes", default=DEFAULT_SIZES, help=f"tamanhos do grimório sintético (padrão {DEFAULT_SIZES})")
+    p.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help=f"chamadas simultâneas (padrão {DEFAULT_CONCURRENCY})")
+    p.add_argument("--commands", default=",".join(COMMANDS), help="comandos medidos, separados por vírgula")
+    p.add_argument("--requests", type=int, default=500, help="chamadas por cenário (padrão 500)")
+    p.add_argument("--warmup", type=int, default=20, help="chamadas descartadas antes de cada cenário")
+    p.add_argument("--send-latency", type=float, default=0.0, help="atraso simulado de cada chamada ao Discord (ms)")
+    p.add_argument("--stub-delay", type=float, default=50.0, help="atraso do servidor de mídia local (ms)")
+    p.add_argument("--stub-fail-rate", type=float, default=0.0, help="fração das páginas de mídia que dão 404")
+    p.add_argument("--image-ratio", type=float, default=0.25, help="fração das magias sintéticas com uma página de mídia extra")
+    p.add_argument("--hot-set", type=int, default=0, help="repete só N consultas distintas por cenário (0 = todas diferentes)")
+    p.add_argument("--autocomplete-len", type=_int_range, default=(1, 6), help="tamanho das consultas de autocomplete, MIN-MAX (padrão 1-6)")
+    p.add_argument("--autocomplete-infix", type=float, default=0.0, help="fração das consultas de autocomplete tiradas do meio do título")
+    p.add_argument("--media-cache", choices=("warm", "off"), default="warm", help="cache de resolução de mídia")
+    p.add_argument("--media-cache-file", default="", help="SQLite do cache de mídia (padrão: só memória)")
+    p.add_argument("--response-cache", choices=("on", "off"), default="on", help="cache de respostas renderizadas (RESPONSE_CACHE)")
+    p.add_argument("--cold-start", action="store_true", help="mede a partida a frio (processo novo) sem e com o snapshot binário")
+    p.add_argument("--base", default=grimorio.JSON_FILE, help="grimório real usado como semente")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="bench_results.json", help="arquivo JSON de saída")
+    return p.parse_args(argv)
+
+async def run_all(args, stub: MediaStub) -> Tuple[List[dict], List[dict]]:
+    commands = [c.strip() for c in args.commands.split(",") if c.strip()]
+    for c in commands:
+        if c not in COMMANDS:
+            raise SystemExit(f"❌ Comando desconhecido: {c} (use {', '.join(COMMANDS)})")
+    base = load_base_spells(args.base)
+    results = []
+    cold = []
+    with tempfile.TemporaryDirectory(prefix="grimorio_bench_") as tmp:
+        for n in _int_list(args.sizes):
+            path = write_grimorio(synth_spells(base, n, stub.base_url, args.image_ratio, args.seed), tmp, n)
+            if args.cold_start:
+                print(f"🧊 {n} magias:")
+                cold.extend(cold_start(path, tmp, n))
+            if not commands:
+                continue
+            snap = grimorio.publish_snapshot(grimorio.build_snapshot(path))
+            print(f"📦 {n} magias: snapshot em {snap.load_seconds:.2f} s")
+            for command in commands:
+                for conc in _int_list(args.concurrency):
+                    reset_media_cache(args.media_cache, args.media_cache_file)
+                    reset_response_cache(args.response_cache)
+                    queries = build_queries(snap, command, args.warmup + args.requests, args.seed, args.hot_set,
+                                            args.autocomplete_len, args.autocomplete_infix)
+                    if args.warmup:
+                        await run_scenario(command, queries[:args.warmup], conc, args.send_latency / 1000)
+                    stub_before = stub.requests
+                    hits_before = grimorio.RESPONSE_CACHE.hits
+                    r = await run_scenario(command, queries[args.warmup:], conc, args.send_latency / 1000)
+                    r = {"size": n, "command": command, "concurrency": conc, "load_s": round(snap.load_seconds, 4),
+                         "media_requests": stub.requests - stub_before,
+                         "response_cache_hits": grimorio.RESPONSE_CACHE.hits - hits_before, **r}
+                    results.append(r)
+                    print(f"  {command:<12} c={conc:<4} p50 {r['p50_ms']:9.3f} ms | p99 {r['p99_ms']:9.3f} ms | "
+                          f"{r['throughput_per_s']:9.1f}/s | cache {r['response_cache_hits']:<5} | erros {r['errors']}")
+    await grimorio.close_media_session()
+    grimorio.media_cache.close()
+    return results, cold
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub = MediaStub(delay=args.stub_delay / 1000, fail_rate=args.stub_fail_rate)
+    stub.start()
+    try:
+        results, cold = asyncio.run(run_all(args, stub))
+    finally:
+        stub.stop()
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k != "out"},
+            "magia_image_mode": grimorio.MAGIA_IMAGE_MODE,
+        },
+        "results": results,
+        "cold_start": cold,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📝 Resultados em {args.out}")
+
+if __name__ == "__main__":
+    main()
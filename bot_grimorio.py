@@ -1,40 +1,450 @@
 # bot.py — Grimório FINAL (versão F, modo 3)
-# Requisitos: python3.8+, pip install discord.py flask requests
+# Requisitos: python3.8+, pip install discord.py
+# (flask + waitress só para o keepalive; requests só para try_resolve_media)
+
+import time
+_IMPORT_STARTED = time.perf_counter()  # o tempo de import entra no relatório de partida
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 import json
+import hashlib
+import pickle
 import re
+import sys
+import math
+import unicodedata
 import os
 import threading
-import time
-from typing import List, Tuple, Optional
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import random
+import secrets
+import signal
+import subprocess
+import sqlite3
+from collections import Counter, OrderedDict
+from typing import Dict, List, Tuple, Optional
+from array import array
+from bisect import bisect_left
+from difflib import SequenceMatcher
 
-# requests é usado para tentar resolver páginas (Tenor / og:image)
-try:
-    import requests
-except Exception:
-    requests = None  # fallback; se não tiver, o bot ainda funciona sem resolução extra
+import aiohttp  # já vem com o discord.py
 
 # -------------------------
 # Keepalive (opcional)
+# - KEEPALIVE=1 liga, KEEPALIVE=0 desliga; sem a variável, liga se PORT estiver
+#   definida (hospedagem web que espera uma porta aberta)
+# - Flask/waitress só são importados quando o keepalive sobe
 # -------------------------
-from flask import Flask
-app = Flask(__name__)
+KEEPALIVE_ENABLED = os.environ.get("KEEPALIVE", "1" if os.environ.get("PORT") else "0") == "1"
+KEEPALIVE_THREADS = int(os.environ.get("KEEPALIVE_THREADS", "4"))
+
+def create_keepalive_app():
+    from flask import Flask, Response, jsonify
+
+    app = Flask(__name__)
+
+    @app.route("/")
+    def home():
+        return "🪄 Grimório ativo!"
 
-@app.route("/")
-def home():
-    return "🪄 Grimório ativo!"
+    @app.route("/ready")
+    def ready():
+        # 200 só com o gateway conectado e o grimório carregado (para monitores de uptime)
+        state = readiness()
+        return jsonify(state), (200 if state["ready"] else 503)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    return app
 
 def run_flask():
-    # Em produção use WSGI; use_reloader=False evita duplicar threads
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8080)), use_reloader=False)
+    # waitress (WSGI de produção); sem ele, cai no servidor de desenvolvimento do Flask
+    app = create_keepalive_app()
+    port = int(os.environ.get("PORT", 8080))
+    try:
+        from waitress import serve
+    except Exception:
+        app.run(host="0.0.0.0", port=port, use_reloader=False)
+        return
+    serve(app, host="0.0.0.0", port=port, threads=KEEPALIVE_THREADS)
 
 # -------------------------
 # Configurações
 # -------------------------
 MAX_IMAGES_SEND = 8  # envia até N imagens por magia (ajuste aqui)
+# "batch": embed principal + imagens juntos, até 10 embeds por mensagem (limite do Discord)
+# "separate": uma mensagem por imagem (comportamento antigo)
+MAGIA_IMAGE_MODE = os.environ.get("MAGIA_IMAGE_MODE", "batch")
+DISCORD_MAX_EMBEDS = 10
+
+
+# -------------------------
+# Métricas (expostas em /metrics no formato do Prometheus)
+# - escritas no loop do bot, lidas pela thread do waitress (só leituras/cópias)
+# -------------------------
+STATS = Counter()      # contadores simples do bot (chamadas REST do /magia etc.)
+IN_FLIGHT = Counter()  # comandos / resoluções em andamento agora
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Histograma cumulativo por label (ex.: nome do comando)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._series: Dict[str, list] = {}  # label -> [contagens por bucket..., +Inf, soma]
+
+    def observe(self, label: str, value: float):
+        series = self._series.get(label)
+        if series is None:
+            series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+        for k, limit in enumerate(self.buckets):
+            if value <= limit:
+                series[k] += 1
+        series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def render(self, name: str, label_name: str) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        for label, series in sorted(dict(self._series).items()):
+            series = list(series)
+            for k, limit in enumerate(self.buckets):
+                lines.append(f'{name}_bucket{{{label_name}="{label}",le="{limit}"}} {series[k]}')
+            lines.append(f'{name}_bucket{{{label_name}="{label}",le="+Inf"}} {series[len(self.buckets)]}')
+            lines.append(f'{name}_sum{{{label_name}="{label}"}} {series[-1]:.6f}')
+            lines.append(f'{name}_count{{{label_name}="{label}"}} {series[len(self.buckets)]}')
+        return lines
+
+COMMAND_LATENCY = Histogram()
+COMMAND_RESULTS = Counter()  # (comando, "ok"/"error") -> total
+
+def instrumented(name: str):
+    """Mede duração, erros e chamadas em andamento de um comando/autocomplete (e abre o trace, se ligado)."""
+    def deco(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            IN_FLIGHT[name] += 1
+            trace = start_trace(name)
+            token = _current_trace.set(trace) if trace is not None else None
+            t0 = time.perf_counter()
+            status = "error"
+            try:
+                result = await func(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                IN_FLIGHT[name] -= 1
+                COMMAND_LATENCY.observe(name, time.perf_counter() - t0)
+                COMMAND_RESULTS[(name, status)] += 1
+                if trace is not None:
+                    _current_trace.reset(token)
+                    finish_trace(trace, status)
+        return wrapper
+    return deco
+
+# -------------------------
+# Tracing por etapa (opcional)
+# - GRIMORIO_TRACE=1 liga spans dentro dos comandos: lookup / resolve / render / send
+# - cada span vira uma linha JSON em GRIMORIO_TRACE_FILE, com os campos do
+#   OpenTelemetry (trace_id, span_id, parent_span_id, *_unix_nano, attributes)
+# - a duração de cada etapa também vai para /metrics (grimorio_stage_duration_seconds)
+# -------------------------
+TRACE_ENABLED = os.environ.get("GRIMORIO_TRACE", "0") == "1"
+TRACE_FILE = os.environ.get("GRIMORIO_TRACE_FILE", "grimorio_traces.jsonl")  # "" = só métricas
+TRACE_SAMPLE = float(os.environ.get("GRIMORIO_TRACE_SAMPLE", "1.0"))        # fração dos comandos rastreados
+TRACE_SERVICE = "grimorio-bot"
+TRACE_FLUSH_INTERVAL = 1.0   # spans saem em lote numa thread, fora do event loop (s)
+TRACE_MAX_PENDING = 50000    # spans na fila; acima disso os novos são descartados (disco lento)
+
+STAGE_LATENCY = Histogram()  # "comando.etapa" -> duração
+_current_trace: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("grimorio_trace", default=None)
+
+class Trace:
+    """Um comando rastreado: span raiz + etapas (nome, início, fim, atributos)."""
+    __slots__ = ("name", "trace_id", "span_id", "start_ns", "spans")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.start_ns = time.time_ns()
+        self.spans: List[Tuple[str, int, int, dict]] = []
+
+class TraceExporter:
+    """
+    Grava spans em JSON lines (um objeto por linha). Erro de disco desliga o arquivo.
+    export() só enfileira; uma thread serializa e grava em lote (nada de I/O no loop).
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.exported = 0
+        self.dropped = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    def export(self, records: List[dict]):
+        if not self.path or self._stop.is_set():
+            return
+        with self._lock:
+            if len(self._pending) + len(records) > TRACE_MAX_PENDING:
+                self.dropped += len(records)
+                return
+            self._pending.extend(records)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+
+    def _writer_loop(self):
+        while not self._stop.wait(TRACE_FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            records, self._pending = self._pending, []
+        if not records or not self.path:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            print("⚠️ Exportação de traces desligada:", e)
+            self.path = ""
+            return
+        self.exported += len(records)
+
+    def close(self):
+        self._stop.set()
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.join()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+TRACE_EXPORTER = TraceExporter(TRACE_FILE if TRACE_ENABLED else "")
+
+def start_trace(name: str) -> Optional[Trace]:
+    if not TRACE_ENABLED or (TRACE_SAMPLE < 1.0 and random.random() >= TRACE_SAMPLE):
+        return None
+    return Trace(name)
+
+@contextlib.contextmanager
+def span(stage: str, **attributes):
+    """
+    Mede uma etapa do comando atual; sem trace ativo não faz nada.
+    Devolve o dict de atributos, que pode ser completado dentro do bloco.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield attributes
+        return
+    start = time.time_ns()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        trace.spans.append((stage, start, time.time_ns(), attributes))
+
+def _span_record(trace: Trace, span_id: str, parent: str, name: str, start: int, end: int,
+                 attributes: dict, status: str = "ok") -> dict:
+    return {
+        "trace_id": trace.trace_id,
+        "span_id": span_id,
+        "parent_span_id": parent,
+        "name": name,
+        "start_time_unix_nano": start,
+        "end_time_unix_nano": end,
+        "attributes": {"service.name": TRACE_SERVICE, **attributes},
+        "status": {"code": "ERROR" if status == "error" or "error" in attributes else "OK"},
+    }
+
+def finish_trace(trace: Trace, status: str):
+    end = time.time_ns()
+    for stage, start, stop, _ in trace.spans:
+        STAGE_LATENCY.observe(f"{trace.name}.{stage}", (stop - start) / 1e9)
+    if not TRACE_EXPORTER.path:
+        return
+    records = [_span_record(trace, trace.span_id, "", trace.name, trace.start_ns, end, {"command": trace.name}, status)]
+    for stage, start, stop, attributes in trace.spans:
+        records.append(_span_record(trace, secrets.token_hex(8), trace.span_id, f"{trace.name}.{stage}",
+                                    start, stop, attributes))
+    TRACE_EXPORTER.export(records)
+
+# -------------------------
+# Profiler por amostragem (ligado/desligado em runtime pelo /profiler)
+# - uma thread lê a pilha da thread do loop a cada PROFILE_INTERVAL s (sem
+#   instrumentar nada: custo fixo, independente do que o bot estiver fazendo)
+# - ao desligar, as pilhas vão para um arquivo "folded" (flamegraph.pl / speedscope)
+# -------------------------
+PROFILE_INTERVAL = float(os.environ.get("GRIMORIO_PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.environ.get("GRIMORIO_PROFILE_DIR", ".")
+PROFILE_MAX_SECONDS = 600  # desliga sozinho se ninguém desligar
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()  # "f1 (a.py:10);f2 (b.py:20)" -> amostras
+        self.samples = 0
+        self.idle = 0            # loop parado esperando eventos (selector)
+        self.started_at = 0.0
+        self._target = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def expired(self) -> bool:
+        """Passou de max_seconds: parou de amostrar, mas ainda não foi desligado/gravado."""
+        return self._thread is not None and not self._thread.is_alive()
+
+    def start(self, thread_id: Optional[int] = None) -> bool:
+        if self._thread is not None:
+            return False
+        self.stacks = Counter()
+        self.samples = self.idle = 0
+        self.started_at = time.time()
+        self._target = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="grimorio-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            self.samples += 1
+            if frame.f_code.co_name == "select" and frame.f_code.co_filename.endswith("selectors.py"):
+                self.idle += 1
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> bool:
+        if self._thread is None:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return True
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        """Funções com mais amostras na ponta da pilha (tempo próprio)."""
+        own = Counter()
+        for stack, k in dict(self.stacks).items():
+            own[stack.rsplit(";", 1)[-1]] += k
+        return own.most_common(n)
+
+    def dump(self, directory: str = PROFILE_DIR) -> str:
+        path = os.path.join(directory, time.strftime("grimorio_profile_%Y%m%d_%H%M%S.folded"))
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, k in self.stacks.most_common():
+                f.write(f"{stack} {k}\n")
+        return path
+
+PROFILER = SamplingProfiler()
+
+def readiness() -> dict:
+    snap = GRIMORIO
+    connected = bot.is_ready() and not bot.is_closed()
+    return {
+        "ready": connected and len(snap.magias) > 0,
+        "gateway": connected,
+        "spells": len(snap.magias),
+        "dataset_version": snap.version,
+    }
+
+def render_metrics() -> str:
+    snap = GRIMORIO
+    lines = COMMAND_LATENCY.render("grimorio_command_duration_seconds", "command")
+    lines += STAGE_LATENCY.render("grimorio_stage_duration_seconds", "stage")
+    lines.append("# TYPE grimorio_command_results_total counter")
+    for (cmd, status), n in sorted(dict(COMMAND_RESULTS).items()):
+        lines.append(f'grimorio_command_results_total{{command="{cmd}",status="{status}"}} {n}')
+    lines.append("# TYPE grimorio_response_cache_total counter")
+    for (cmd, result), n in sorted(dict(RESPONSE_CACHE_RESULTS).items()):
+        lines.append(f'grimorio_response_cache_total{{command="{cmd}",result="{result}"}} {n}')
+    lines.append("# TYPE grimorio_throttled_total counter")
+    for (cmd, scope), n in sorted(dict(THROTTLED).items()):
+        lines.append(f'grimorio_throttled_total{{command="{cmd}",scope="{scope}"}} {n}')
+    lines.append("# TYPE grimorio_in_flight gauge")
+    for key, n in sorted(dict(IN_FLIGHT).items()):
+        lines.append(f'grimorio_in_flight{{what="{key}"}} {n}')
+    for key, n in sorted(dict(STATS).items()):
+        lines.append(f"# TYPE grimorio_{key}_total counter")
+        lines.append(f"grimorio_{key}_total {n}")
+    hits, misses = media_cache.hits, media_cache.misses
+    report = MEDIA_REPORT
+    lines += [
+        "# TYPE grimorio_media_cache_hits_total counter",
+        f"grimorio_media_cache_hits_total {hits}",
+        "# TYPE grimorio_media_cache_misses_total counter",
+        f"grimorio_media_cache_misses_total {misses}",
+        "# TYPE grimorio_media_cache_hit_ratio gauge",
+        f"grimorio_media_cache_hit_ratio {(hits / (hits + misses)) if hits + misses else 0.0:.4f}",
+        "# TYPE grimorio_media_cache_entries gauge",
+        f"grimorio_media_cache_entries {len(media_cache)}",
+        "# TYPE grimorio_media_broken_links gauge",
+        f"grimorio_media_broken_links {len(report.get('broken', ()))}",
+        "# TYPE grimorio_media_failed_links gauge",
+        f"grimorio_media_failed_links {len(report.get('failed', ()))}",
+        "# TYPE grimorio_media_prewarm_seconds gauge",
+        f"grimorio_media_prewarm_seconds {report.get('seconds', 0.0)}",
+        "# TYPE grimorio_response_cache_entries gauge",
+        f"grimorio_response_cache_entries {len(RESPONSE_CACHE)}",
+        "# TYPE grimorio_spells gauge",
+        f"grimorio_spells {len(snap.magias)}",
+        "# TYPE grimorio_dataset_version gauge",
+        f"grimorio_dataset_version {snap.version}",
+        "# TYPE grimorio_dataset_load_seconds gauge",
+        f"grimorio_dataset_load_seconds {snap.load_seconds:.6f}",
+        "# TYPE grimorio_trace_spans_exported_total counter",
+        f"grimorio_trace_spans_exported_total {TRACE_EXPORTER.exported}",
+        "# TYPE grimorio_trace_spans_dropped_total counter",
+        f"grimorio_trace_spans_dropped_total {TRACE_EXPORTER.dropped}",
+        "# TYPE grimorio_profiler_running gauge",
+        f"grimorio_profiler_running {int(PROFILER.running)}",
+        "# TYPE grimorio_startup_seconds gauge",
+        *(f'grimorio_startup_seconds{{stage="{k}"}} {v:.6f}' for k, v in sorted(dict(STARTUP).items())),
+        "# TYPE grimorio_gateway_up gauge",
+        f"grimorio_gateway_up {int(bot.is_ready() and not bot.is_closed())}",
+    ]
+    if bot.is_ready():
+        lines += ["# TYPE grimorio_gateway_latency_seconds gauge", f"grimorio_gateway_latency_seconds {bot.latency:.6f}"]
+        lines.append("# TYPE grimorio_shard_latency_seconds gauge")
+        for shard_id, lat in getattr(bot, "latencies", [(bot.shard_id or 0, bot.latency)]):
+            lines.append(f'grimorio_shard_latency_seconds{{shard="{shard_id}"}} {lat:.6f}')
+    lines.append("# TYPE grimorio_shard_interactions_total counter")
+    for shard_id, n in sorted(dict(SHARD_INTERACTIONS).items()):
+        lines.append(f'grimorio_shard_interactions_total{{shard="{shard_id}"}} {n}')
+    return "\n".join(lines) + "\n"
 
 ELEMENT_ICONS = {
     "fogo":"🔥","fire":"🔥",
@@ -68,10 +478,24 @@ def clean_str(s: Optional[str]) -> str:
     t = re.sub(r"\s+", " ", t).strip()
     return t.lower()
 
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def fold_accents(s: str) -> str:
+    """'Água Ígnea' -> 'agua ignea' (minúsculo, sem acentos/cedilha)."""
+    t = unicodedata.normalize("NFKD", str(s).lower())
+    return "".join(c for c in t if not unicodedata.combining(c))
+
 def normalize_query(q: Optional[str]) -> str:
     if not q:
         return ""
-    return re.sub(r"[^a-z0-9]", "", str(q).lower())
+    return _NON_ALNUM_RE.sub("", fold_accents(q))
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Palavras (2+ letras) sem acento, para o índice de busca."""
+    if not text:
+        return []
+    return [t for t in _TOKEN_RE.findall(fold_accents(text)) if len(t) > 1]
 
 def get_element_icon(raw: Optional[str]) -> Tuple[str,str]:
     raw = raw or ""
@@ -87,69 +511,493 @@ def get_element_icon(raw: Optional[str]) -> Tuple[str,str]:
         return clean, m.group(1)
     return clean, "❔"
 
+_HTML_BLOCK_TAG_RE = re.compile(r"</?(p|div|span|strong|em|b|i|u)[^>]*>", re.IGNORECASE)
+_HTML_IMG_TAG_RE = re.compile(r"<img[^>]*>", re.IGNORECASE)
+_HTML_ANY_TAG_RE = re.compile(r"<[^>]+>")
+_CRLF_RE = re.compile(r"\r\n?")
+_MULTI_NL_RE = re.compile(r"\n{2,}")
+
 def strip_html_basic(text: str) -> str:
     if not text:
         return ""
     t = str(text)
     t = t.replace("<br>", "\n").replace("<br/>", "\n").replace("<br />", "\n")
-    t = re.sub(r"</?(p|div|span|strong|em|b|i|u)[^>]*>", "\n", t, flags=re.IGNORECASE)
-    t = re.sub(r"<img[^>]*>", "", t, flags=re.IGNORECASE)
-    t = re.sub(r"<[^>]+>", "", t)
-    t = re.sub(r"\r\n?", "\n", t)
-    t = re.sub(r"\n{2,}", "\n\n", t)
+    t = _HTML_BLOCK_TAG_RE.sub("\n", t)
+    t = _HTML_IMG_TAG_RE.sub("", t)
+    t = _HTML_ANY_TAG_RE.sub("", t)
+    t = _CRLF_RE.sub("\n", t)
+    t = _MULTI_NL_RE.sub("\n\n", t)
     return t.strip()
 
 # -------------------------
 # Resolver links (Tenor/og:image)
 # - tenta pegar og:image ou primeira <meta property="og:image" content="...">
-# - requer 'requests' instalado; se não, apenas retorna a url original
+# - try_resolve_media: versão síncrona (ferramentas/scripts); requer 'requests'
+# - resolve_media_async / resolve_media_many: versão usada pelo bot, sem bloquear o loop
 # -------------------------
-def try_resolve_media(url: str, timeout: float = 3.0) -> str:
+MEDIA_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) GrimorioBot/1.0"
+MEDIA_RESOLVE_TIMEOUT = 3.0       # prazo por página (s)
+MEDIA_RESOLVE_DEADLINE = 4.0      # prazo total para as imagens de uma magia (s)
+MEDIA_RESOLVE_CONCURRENCY = 8     # resoluções simultâneas no bot inteiro
+MEDIA_RESOLVE_SLOT_WAIT = 0.25    # espera máxima por uma vaga; depois usa o url original
+MEDIA_HTML_MAX_BYTES = 256 * 1024 # og:image fica no <head>; não precisa baixar a página toda
+
+_DIRECT_MEDIA_RE = re.compile(r"\.(gif|png|jpg|jpeg|webp|mp4|webm)(?:\?.*)?$", re.IGNORECASE)
+_OG_IMAGE_RE = re.compile(r'<meta[^>]+property=["\']og:image["\'][^>]+content=["\']([^"\']+)["\']', re.IGNORECASE)
+_TWITTER_IMAGE_RE = re.compile(r'<meta[^>]+name=["\']twitter:image["\'][^>]+content=["\']([^"\']+)["\']', re.IGNORECASE)
+_FIRST_IMG_RE = re.compile(r'<img[^>]+src=["\']([^"\']+)["\']', re.IGNORECASE)
+
+def is_direct_media(url: str) -> bool:
+    return bool(url) and bool(_DIRECT_MEDIA_RE.search(url))
+
+def find_media_in_html(html: str) -> str:
+    """Procura og:image, twitter:image e por fim o primeiro <img>; retorna "" se nada achar."""
+    if not html:
+        return ""
+    m = _OG_IMAGE_RE.search(html)
+    if m and m.group(1).strip():
+        return m.group(1).strip()
+    m = _TWITTER_IMAGE_RE.search(html)
+    if m:
+        return m.group(1).strip()
+    m = _FIRST_IMG_RE.search(html)
+    if m:
+        return m.group(1).strip()
+    return ""
+
+def try_resolve_media(url: str, timeout: float = MEDIA_RESOLVE_TIMEOUT) -> str:
     """
     Tenta retornar um URL direto de imagem para o url fornecido.
     Se não conseguir, retorna o url original.
+    Bloqueante: não chamar de dentro de comandos (use resolve_media_async).
     """
     if not url:
         return url
     # quick heuristic: if url already ends with image ext, return it
-    if re.search(r"\.(gif|png|jpg|jpeg|webp|mp4|webm)(?:\?.*)?$", url, flags=re.IGNORECASE):
+    if is_direct_media(url):
         return url
 
-    # if requests unavailable, give up
-    if not requests:
+    # requests só é importado aqui (scripts/ferramentas); sem ele, desiste
+    try:
+        import requests
+    except Exception:
         return url
 
     try:
-        headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) GrimorioBot/1.0"}
+        headers = {"User-Agent": MEDIA_USER_AGENT}
         r = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
         if r.status_code != 200:
             return url
-        html = r.text
+        return find_media_in_html(r.text) or url
+    except Exception:
+        return url
 
-        # try og:image
-        m = re.search(r'<meta[^>]+property=["\']og:image["\'][^>]+content=["\']([^"\']+)["\']', html, flags=re.IGNORECASE)
-        if m:
-            candidate = m.group(1).strip()
-            if candidate:
-                return candidate
+# -------------------------
+# Cache de resolução de mídia (url original -> url resolvido)
+# - LRU em memória + TTL; falhas ficam em cache negativo por menos tempo
+# - cópia em SQLite para o bot reiniciar já "quente"; só é aberta na partida
+#   (start_bot), então importar o módulo não cria nem lê arquivo nenhum
+# -------------------------
+MEDIA_CACHE_FILE = os.environ.get("MEDIA_CACHE_FILE", "media_cache.sqlite3")  # "" desliga o disco
+MEDIA_CACHE_MAX = 4096
+MEDIA_CACHE_TTL = 7 * 24 * 3600        # resoluções que deram certo (s)
+MEDIA_CACHE_NEGATIVE_TTL = 15 * 60     # páginas que falharam (s)
+MEDIA_CACHE_BROKEN_TTL = 24 * 3600     # links quebrados (404/410): o envio pula (s)
+MEDIA_BROKEN_STATUS = (404, 410)
+MEDIA_CACHE_FLUSH_INTERVAL = 2.0       # escritas no SQLite saem em lote numa thread (s)
 
-        # try twitter image meta
-        m2 = re.search(r'<meta[^>]+name=["\']twitter:image["\'][^>]+content=["\']([^"\']+)["\']', html, flags=re.IGNORECASE)
-        if m2:
-            return m2.group(1).strip()
+class MediaCache:
+    """
+    Cache de resoluções de mídia com LRU, TTL e cache negativo.
+    get() retorna (url_resolvido, ok) ou None se não houver entrada válida.
+    Link quebrado fica como ("", False).
+    """
 
-        # try first <img src="">
-        m3 = re.search(r'<img[^>]+src=["\']([^"\']+)["\']', html, flags=re.IGNORECASE)
-        if m3:
-            return m3.group(1).strip()
+    def __init__(self, path: str = "", max_entries: int = MEDIA_CACHE_MAX,
+                 ttl: float = MEDIA_CACHE_TTL, negative_ttl: float = MEDIA_CACHE_NEGATIVE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[str, bool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # linhas ainda não gravadas (url -> linha); a thread de escrita esvazia em lote
+        self._pending: Dict[str, Tuple[str, str, int, float]] = {}
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        if path:
+            self.open(path)
 
-        return url
+    def open(self, path: str):
+        """Liga a cópia em SQLite e carrega as entradas ainda válidas (as da memória vencem)."""
+        if path and self._db is None:
+            self._open_db(path)
+
+    def _open_db(self, path: str):
+        try:
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS media (url TEXT PRIMARY KEY, resolved TEXT NOT NULL, ok INTEGER NOT NULL, expires REAL NOT NULL)")
+            now = time.time()
+            db.execute("DELETE FROM media WHERE expires < ?", (now,))
+            rows = db.execute(
+                "SELECT url, resolved, ok, expires FROM media ORDER BY expires DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+            db.commit()
+        except Exception as e:
+            print("⚠️ Cache de mídia sem disco:", e)
+            return
+        # mais antigos primeiro, para a ordem LRU ficar coerente; o que já está na memória é mais novo
+        loaded: "OrderedDict[str, Tuple[str, bool, float]]" = OrderedDict(
+            (url, (resolved, bool(ok), expires)) for url, resolved, ok, expires in reversed(rows)
+        )
+        with self._lock:
+            for url, item in self._entries.items():
+                loaded.pop(url, None)
+                loaded[url] = item
+                self._pending[url] = (url, item[0], int(item[1]), item[2])
+            while len(loaded) > self.max_entries:
+                loaded.popitem(last=False)
+            self._entries = loaded
+            self._db = db
+        self._writer = threading.Thread(target=self._writer_loop, name="media-cache-writer", daemon=True)
+        self._writer.start()
+        print(f"🗃️ Cache de mídia carregado: {len(rows)} entradas")
+
+    def get(self, url: str) -> Optional[Tuple[str, bool]]:
+        with self._lock:
+            item = self._entries.get(url)
+            if item is None:
+                self.misses += 1
+                return None
+            resolved, ok, expires = item
+            if expires < time.time():
+                del self._entries[url]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return resolved, ok
+
+    def put(self, url: str, resolved: str, ok: bool = True, ttl: Optional[float] = None):
+        if ttl is None:
+            ttl = self.ttl if ok else self.negative_ttl
+        expires = time.time() + ttl
+        with self._lock:
+            self._entries[url] = (resolved, ok, expires)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._db is not None:
+                # nada de SQLite no loop: só enfileira, a thread grava depois
+                self._pending[url] = (url, resolved, int(ok), expires)
+
+    def _writer_loop(self):
+        while not self._stop.wait(MEDIA_CACHE_FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        """Grava as linhas pendentes numa única transação (executemany + commit)."""
+        with self._lock:
+            if not self._pending or self._db is None:
+                return
+            rows = list(self._pending.values())
+            self._pending.clear()
+            db = self._db
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO media (url, resolved, ok, expires) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            db.commit()
+        except Exception as e:
+            print("⚠️ Falha ao gravar cache de mídia:", e)
+
+    def peek(self, url: str) -> Optional[Tuple[str, bool]]:
+        """Como get(), mas sem mexer na ordem LRU nem nos contadores (pré-aquecimento)."""
+        with self._lock:
+            item = self._entries.get(url)
+        if item is None or item[2] < time.time():
+            return None
+        return item[0], item[1]
+
+    def is_broken(self, url: str) -> bool:
+        return self.peek(url) == ("", False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                try:
+                    self._db.close()
+                except Exception:
+                    pass
+                self._db = None
+
+media_cache = MediaCache()  # só memória até start_bot chamar media_cache.open(MEDIA_CACHE_FILE)
+
+# sessão HTTP compartilhada (pool de conexões) + limite global de resoluções em andamento
+_media_session: Optional[aiohttp.ClientSession] = None
+_media_slots: Optional[asyncio.Semaphore] = None
+
+def _get_media_session() -> aiohttp.ClientSession:
+    global _media_session
+    if _media_session is None or _media_session.closed:
+        _media_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MEDIA_RESOLVE_CONCURRENCY, ttl_dns_cache=300),
+            headers={"User-Agent": MEDIA_USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=MEDIA_RESOLVE_TIMEOUT),
+        )
+    return _media_session
+
+def _get_media_slots() -> asyncio.Semaphore:
+    global _media_slots
+    if _media_slots is None:
+        _media_slots = asyncio.Semaphore(MEDIA_RESOLVE_CONCURRENCY)
+    return _media_slots
+
+async def close_media_session():
+    global _media_session
+    if _media_session is not None and not _media_session.closed:
+        await _media_session.close()
+    _media_session = None
+
+async def _fetch_media(url: str) -> Optional[str]:
+    """Baixa a página e procura a mídia. None = falhou (status != 200 ou erro de rede); "" = link quebrado."""
+    try:
+        async with _get_media_session().get(url, allow_redirects=True) as r:
+            if r.status in MEDIA_BROKEN_STATUS:
+                return ""
+            if r.status != 200:
+                return None
+            raw = await r.content.read(MEDIA_HTML_MAX_BYTES)
+        html = raw.decode(r.charset or "utf-8", errors="ignore")
+        return find_media_in_html(html) or url
     except Exception:
+        return None
+
+async def resolve_media_async(url: str, slot_wait: Optional[float] = MEDIA_RESOLVE_SLOT_WAIT) -> str:
+    """
+    Igual a try_resolve_media, mas sem bloquear o event loop.
+    Consulta media_cache antes de qualquer requisição.
+    Se todas as vagas estiverem ocupadas por mais de slot_wait (None = espera o quanto for),
+    ou a página falhar/demorar, retorna o url original. Link quebrado retorna "".
+    """
+    if not url:
+        return url
+    if is_direct_media(url):
+        return "" if media_cache.is_broken(url) else url
+    cached = media_cache.get(url)
+    if cached is not None:
+        return cached[0]
+    slots = _get_media_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), slot_wait)
+    except asyncio.TimeoutError:
+        return url  # não vai para o cache: a página nem foi tentada
+    IN_FLIGHT["media_resolve"] += 1
+    try:
+        resolved = await _fetch_media(url)
+    finally:
+        IN_FLIGHT["media_resolve"] -= 1
+        slots.release()
+    if resolved is None:
+        media_cache.put(url, url, ok=False)
         return url
+    if not resolved:
+        media_cache.put(url, "", ok=False, ttl=MEDIA_CACHE_BROKEN_TTL)
+        return ""
+    media_cache.put(url, resolved)
+    return resolved
+
+async def resolve_media_many(urls: List[str], deadline: float = MEDIA_RESOLVE_DEADLINE) -> List[str]:
+    """
+    Resolve as urls em paralelo dentro de um prazo total.
+    O que não terminar a tempo fica com o url original; link quebrado sai da lista.
+    Mantém ordem, sem repetidos.
+    """
+    if not urls:
+        return []
+    urls = list(dict.fromkeys(urls))  # a mesma url só é resolvida uma vez
+    tasks = [asyncio.ensure_future(resolve_media_async(u)) for u in urls]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for t in pending:
+        t.cancel()
+    final = []
+    seen = set()
+    for u, t in zip(urls, tasks):
+        r = u
+        if t in done and not t.cancelled() and t.exception() is None:
+            r = t.result()
+            if r == "":
+                continue  # quebrado (404/410): o envio pula
+            r = r or u
+        if r and r not in seen:
+            final.append(r); seen.add(r)
+    return final
+
+# -------------------------
+# Pré-aquecimento de mídia (em segundo plano)
+# - depois do on_ready e de cada reload, passa por todas as urls de imagem do grimório
+#   com concorrência limitada: páginas vão para o media_cache, mídias diretas levam um HEAD
+# - links quebrados (404/410) ficam marcados no cache e o /magia pula essas imagens
+# - relatório das magias com links quebrados/falhos em MEDIA_REPORT_FILE
+# -------------------------
+MEDIA_PREWARM = os.environ.get("MEDIA_PREWARM", "1") == "1"
+MEDIA_PREWARM_CONCURRENCY = 4  # metade das vagas do resolvedor; o resto fica para os comandos
+MEDIA_REPORT_FILE = os.environ.get("MEDIA_REPORT_FILE", "media_report.json")  # "" = só no log
+
+_prewarm_task: Optional[asyncio.Task] = None
+_prewarm_version = 0
+MEDIA_REPORT: dict = {}  # último relatório (também em /metrics)
+
+async def check_media_link(url: str) -> Optional[bool]:
+    """HEAD numa mídia direta: True = ok, False = quebrada (404/410), None = não deu para saber."""
+    async with _get_media_slots():
+        IN_FLIGHT["media_resolve"] += 1
+        try:
+            async with _get_media_session().head(url, allow_redirects=True) as r:
+                if r.status in MEDIA_BROKEN_STATUS:
+                    return False
+                return True if r.status < 400 else None
+        except Exception:
+            return None
+        finally:
+            IN_FLIGHT["media_resolve"] -= 1
+
+async def prewarm_media(snap: "GrimorioSnapshot") -> dict:
+    """Resolve/valida as imagens do snapshot e devolve o relatório (ok / quebradas / falhas)."""
+    t0 = time.perf_counter()
+    spells_by_url: Dict[str, List[str]] = {}
+    for m in snap.magias:
+        for u in m.images[:MAX_IMAGES_SEND]:
+            spells_by_url.setdefault(u, []).append(m.title)
+    urls = list(spells_by_url)
+    # mais urls que o cache comporta: o próprio job expulsaria o que acabou de resolver
+    skipped = max(0, len(urls) - media_cache.max_entries)
+    urls = urls[:media_cache.max_entries]
+
+    status: Dict[str, str] = {}
+    sem = asyncio.Semaphore(MEDIA_PREWARM_CONCURRENCY)
+
+    async def one(url: str):
+        async with sem:
+            if is_direct_media(url):
+                if media_cache.is_broken(url):
+                    status[url] = "broken"
+                    return
+                ok = await check_media_link(url)
+                if ok is False:
+                    media_cache.put(url, "", ok=False, ttl=MEDIA_CACHE_BROKEN_TTL)
+                status[url] = {True: "ok", False: "broken", None: "failed"}[ok]
+                return
+            resolved = await resolve_media_async(url, slot_wait=None)
+            # página sem mídia (ou que falhou) volta como o próprio url
+            status[url] = "broken" if resolved == "" else ("failed" if resolved == url else "ok")
+
+    await asyncio.gather(*(one(u) for u in urls))
+
+    def entries(kind):
+        return [{"url": u, "spells": spells_by_url[u]} for u in urls if status.get(u) == kind]
+
+    report = {
+        "dataset_version": snap.version,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "seconds": round(time.perf_counter() - t0, 3),
+        "urls": len(urls),
+        "skipped": skipped,
+        "ok": sum(1 for v in status.values() if v == "ok"),
+        "broken": entries("broken"),
+        "failed": entries("failed"),
+    }
+    return report
+
+def _write_media_report(report: dict, path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+async def _run_media_prewarm(snap: "GrimorioSnapshot"):
+    global MEDIA_REPORT
+    try:
+        report = await prewarm_media(snap)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print("❌ Pré-aquecimento de mídia falhou:", e)
+        return
+    MEDIA_REPORT = report
+    STATS["media_prewarm_runs"] += 1
+    if report["broken"]:
+        # /magia guardado antes da validação pode ter embed de um link que agora está marcado
+        # como quebrado (url direta volta igual até ser checada); a próxima chamada refaz sem ele
+        RESPONSE_CACHE.drop(lambda key: key[0] == "magia")
+    print(f"🖼️ Mídia pré-aquecida (v{report['dataset_version']}): {report['ok']} ok, "
+          f"{len(report['broken'])} quebradas, {len(report['failed'])} falharam ({report['seconds']:.1f} s)")
+    if MEDIA_REPORT_FILE:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, _write_media_report, report, MEDIA_REPORT_FILE)
+        except OSError as e:
+            print("⚠️ Relatório de mídia não gravado:", e)
+
+def start_media_prewarm(snap: "GrimorioSnapshot"):
+    """Agenda o job para o snapshot; um job de snapshot antigo é cancelado."""
+    global _prewarm_task, _prewarm_version
+    if not MEDIA_PREWARM or snap.version == _prewarm_version:
+        return
+    if _prewarm_task is not None and not _prewarm_task.done():
+        _prewarm_task.cancel()
+    _prewarm_version = snap.version
+    _prewarm_task = asyncio.create_task(_run_media_prewarm(snap))
+
+async def stop_media_prewarm():
+    if _prewarm_task is not None and not _prewarm_task.done():
+        _prewarm_task.cancel()
+        try:
+            await _prewarm_task
+        except (asyncio.CancelledError, Exception):
+            pass
 
 # -------------------------
 # Extrator: imagens + campos (Efeito multiline, limitações multilinha, notas)
+# regexes compiladas uma vez; o extrator roda só no load_spells (ver parse_spell)
 # -------------------------
+_IMG_SRC_RE = re.compile(r'<img[^>]*src=["\']([^"\']+)["\']', re.IGNORECASE)
+_MEDIA_URL_RE = re.compile(r'(https?://[^\s\'"<>]+\.(?:gif|png|jpg|jpeg|webp|mp4|webm))', re.IGNORECASE)
+# labels que terminam o bloco de efeito
+_EFFECT_END_LABELS = r'(?:\n(?:Custo|Mana|Cost|Cooldown|CD|Dura(?:ç|c)ao|Duracao|Duration|Limita(?:ç|c)[oõ]es|Limitacoes|Restricoes|Restrições)\s*:)'
+_EFFECT_RE = re.compile(r'(?:^|\n)(?:Efeito|Effect)\s*:\s*(.+?)(?=' + _EFFECT_END_LABELS + r'|$)', re.IGNORECASE | re.DOTALL)
+_EFFECT_SPLIT_RE = re.compile(r'(?:^|\n)(?:Efeito|Effect)\s*:', re.IGNORECASE)
+_LIMITS_RE = re.compile(
+    r'(?:^|\n)(?:Limitações|Limitacoes|Limita(?:ç|c)[oõ]es|Restrições|Restricoes)\s*:\s*(.+?)(?=\n(?:Custo|Cooldown|Dura|Efeito|Notas|$)|$)',
+    re.IGNORECASE | re.DOTALL,
+)
+_LIMITS_SPLIT_RE = re.compile(r'[\n•\-]')
+
+def _single_field_res(labels):
+    return [re.compile(rf'(?:^|\n){re.escape(L)}\s*:\s*(.+?)(?:\n|$)', re.IGNORECASE) for L in labels]
+
+_COST_RES = _single_field_res(["Custo","Mana","Cost","Custo de mana"])
+_COOLDOWN_RES = _single_field_res(["Cooldown","CD"])
+_DURATION_RES = _single_field_res(["Duração","Duracao","Duration"])
+# linhas de campos removidas das notas (na ordem, uma passada por label)
+_NOTE_FIELD_RES = [
+    re.compile(rf'(?:^|\n){lab}\s*:\s*.+?(?:\n|$)', re.IGNORECASE)
+    for lab in ["Custo","Mana","Cost","Cooldown","CD","Duração","Duracao","Duration","Limitações","Limitacoes","Restrições","Restricoes"]
+]
+
 def extract_images_and_fields(desc_raw: str):
     """
     Retorna:
@@ -160,21 +1008,25 @@ def extract_images_and_fields(desc_raw: str):
       duracao (str),
       lista_lim (list[str]),
       notas (str),
-      imagens_resolvidas (list[str])
+      imagens (list[str])  (urls originais; resolver com resolve_media_many)
     """
+    return _extract_fields(desc_raw)[:8]
+
+def _extract_fields(desc_raw: str):
+    """Igual a extract_images_and_fields, mais o texto limpo (sem html) no fim da tupla."""
     if not desc_raw:
-        return "", "", "", "", "", [], "", []
+        return "", "", "", "", "", [], "", [], ""
 
     s = str(desc_raw)
 
     # 1) coletar imagens / gifs (preservando ordem)
     imgs = []
     seen = set()
-    for m in re.finditer(r'<img[^>]*src=["\']([^"\']+)["\']', s, flags=re.IGNORECASE):
+    for m in _IMG_SRC_RE.finditer(s):
         url = m.group(1).strip()
         if url and url not in seen:
             imgs.append(url); seen.add(url)
-    for m in re.finditer(r'(https?://[^\s\'"<>]+\.(?:gif|png|jpg|jpeg|webp|mp4|webm))', s, flags=re.IGNORECASE):
+    for m in _MEDIA_URL_RE.finditer(s):
         url = m.group(1).strip()
         if url and url not in seen:
             imgs.append(url); seen.add(url)
@@ -183,39 +1035,33 @@ def extract_images_and_fields(desc_raw: str):
     clean = strip_html_basic(s)
 
     # 3) extrair efeito bloco multiline (captura até próximo label)
-    # labels que terminam o bloco de efeito
-    end_labels = r'(?:\n(?:Custo|Mana|Cost|Cooldown|CD|Dura(?:ç|c)ao|Duracao|Duration|Limita(?:ç|c)[oõ]es|Limitacoes|Restricoes|Restrições)\s*:)'
-    m_eff = re.search(r'(?:^|\n)(?:Efeito|Effect)\s*:\s*(.+?)(?=' + end_labels + r'|$)', clean, flags=re.IGNORECASE | re.DOTALL)
+    m_eff = _EFFECT_RE.search(clean)
     efeito = m_eff.group(1).strip() if m_eff else ""
 
     # 4) campos single-line tolerantes
-    def single(labels):
-        for L in labels:
-            m = re.search(rf'(?:^|\n){re.escape(L)}\s*:\s*(.+?)(?:\n|$)', clean, flags=re.IGNORECASE)
+    def single(patterns):
+        for rx in patterns:
+            m = rx.search(clean)
             if m:
                 return m.group(1).strip()
         return ""
-    custo = single(["Custo","Mana","Cost","Custo de mana"])
-    cooldown = single(["Cooldown","CD"])
-    duracao = single(["Duração","Duracao","Duration"])
+    custo = single(_COST_RES)
+    cooldown = single(_COOLDOWN_RES)
+    duracao = single(_DURATION_RES)
 
     # 5) limitações multilinha (captura bloco inteiro)
     lista_lim = []
-    m_lim = re.search(
-        r'(?:^|\n)(?:Limitações|Limitacoes|Limita(?:ç|c)[oõ]es|Restrições|Restricoes)\s*:\s*(.+?)(?=\n(?:Custo|Cooldown|Dura|Efeito|Notas|$)|$)',
-        clean,
-        flags=re.IGNORECASE | re.DOTALL,
-    )
+    m_lim = _LIMITS_RE.search(clean)
     if m_lim:
         bloco = m_lim.group(1).strip()
-        partes = re.split(r'[\n•\-]', bloco)
+        partes = _LIMITS_SPLIT_RE.split(bloco)
         for p in partes:
             ln = p.strip(" .:•\t\r")
             if ln:
                 lista_lim.append(ln)
 
     # 6) descrição base (antes de Efeito:)
-    parts = re.split(r'(?:^|\n)(?:Efeito|Effect)\s*:', clean, flags=re.IGNORECASE)
+    parts = _EFFECT_SPLIT_RE.split(clean)
     desc_base = parts[0].strip() if parts else clean
 
     # 7) notas/extras: rest of text after removing captured blocks
@@ -225,288 +1071,1397 @@ def extract_images_and_fields(desc_raw: str):
     if m_lim:
         temp = temp.replace(m_lim.group(0), "")
     # remove single fields lines
-    for lab in ["Custo","Mana","Cost","Cooldown","CD","Duração","Duracao","Duration","Limitações","Limitacoes","Restrições","Restricoes"]:
-        temp = re.sub(rf'(?:^|\n){lab}\s*:\s*.+?(?:\n|$)', '\n', temp, flags=re.IGNORECASE)
+    for rx in _NOTE_FIELD_RES:
+        temp = rx.sub('\n', temp)
     # remove desc_base once
     if desc_base:
         temp = temp.replace(desc_base, "", 1)
     notas = temp.strip()
-    notas = re.sub(r'\n{2,}', '\n\n', notas).strip()
+    notas = _MULTI_NL_RE.sub('\n\n', notas).strip()
 
-    # 8) tentar resolver imagens (og:image) para domínios como tenor/twitter/etc (com requests)
-    resolved = []
-    for url in imgs:
-        try:
-            resolved_url = try_resolve_media(url)
-            resolved.append(resolved_url)
-        except Exception:
-            resolved.append(url)
-    # keep order, unique
-    final_imgs = []
-    seen2 = set()
-    for u in resolved:
-        if u and u not in seen2:
-            final_imgs.append(u); seen2.add(u)
+    return desc_base, efeito, custo, cooldown, duracao, lista_lim, notas, imgs, clean
+
+# -------------------------
+# Pré-processamento por magia (uma vez no load_spells / reload)
+# - campos extraídos, limitações juntas e o embed principal já montado
+# -------------------------
+def trunc(t, lim=1024):
+    if not t:
+        return ""
+    t = str(t)
+    return t if len(t) <= lim else t[:lim-3] + "..."
+
+def merge_limits(*groups) -> List[str]:
+    """Junta listas de limitações, sem vazios e sem repetidos (preserva ordem)."""
+    final = []
+    seen = set()
+    for g in groups:
+        for it in g or []:
+            if it and it not in seen:
+                final.append(it); seen.add(it)
+    return final
+
+def build_magia_embed(spell: dict) -> discord.Embed:
+    titulo = spell["title"]
+    icon = spell["icon"] or "❔"
+    elemento = spell["element"].capitalize() if spell["element"] else clean_str(spell["element_raw"]).capitalize() or "Desconhecido"
+    cats = ", ".join(spell["categories"]) if spell["categories"] else "Nenhuma"
+    limits = spell["limits"]
+
+    embed = discord.Embed(title=f"{icon} {titulo}", description=trunc(spell["desc_base"]) or "Sem descrição.", color=discord.Color.orange())
+    embed.add_field(name="🎯 Efeito", value=trunc(spell["effect"]) or "Não informado.", inline=False)
+    if spell["notes"]:
+        embed.add_field(name="📝 Notas / Extras", value=trunc(spell["notes"]), inline=False)
+    embed.add_field(name="💧 Custo", value=spell["cost"] or "?", inline=True)
+    embed.add_field(name="⏳ Cooldown", value=spell["cooldown"] or "?", inline=True)
+    embed.add_field(name="⌛ Duração", value=spell["duration"] or "?", inline=True)
+    embed.add_field(name="⚠️ Limitações", value="\n".join(f"• {l}" for l in limits) if limits else "Nenhuma.", inline=False)
+    embed.set_footer(text=f"Categorias: {cats} — Elemento: {elemento}")
+    return embed
+
+@functools.lru_cache(maxsize=4096)
+def _intern_categories(cats: Tuple[str, ...]) -> Tuple[str, ...]:
+    # tuplas iguais viram o mesmo objeto (muitas magias têm exatamente as mesmas categorias)
+    return tuple(sys.intern(c) for c in cats)
+
+class Spell:
+    """
+    Registro compacto de uma magia: só o que os comandos usam.
+    Os textos longos ficam no embed pronto (e, opcionalmente, no TextBuffer do snapshot).
+    """
+    __slots__ = ("title", "element", "icon", "categories", "images", "embed")
+
+    def __init__(self, title: str, element: str, icon: str, categories: Tuple[str, ...],
+                 images: Tuple[str, ...], embed: discord.Embed):
+        self.title = title
+        self.element = element
+        self.icon = icon
+        self.categories = categories
+        self.images = images
+        self.embed = embed
+
+    def __repr__(self):
+        return f"Spell({self.title!r})"
+
+def parse_spell(spell: dict) -> Tuple[Spell, str]:
+    """
+    Extrai os campos da descrição e monta o embed do /magia.
+    Retorna o registro compacto e o texto limpo da descrição (para o índice de busca).
+    """
+    desc_base, efeito, custo, cooldown, duracao, lista_lim, notas, imagens, clean = _extract_fields(spell["description"] or "")
+    fields = dict(spell)
+    fields.update({
+        "desc_base": desc_base,
+        "effect": efeito,
+        "cost": custo,
+        "cooldown": cooldown,
+        "duration": duracao,
+        "limits": merge_limits(spell["explicit_limits"], lista_lim),
+        "notes": notas,
+    })
+    record = Spell(
+        title=spell["title"],
+        element=sys.intern(spell["element"]),
+        icon=spell["icon"],
+        categories=_intern_categories(tuple(spell["categories"])),
+        images=tuple(imagens),
+        embed=build_magia_embed(fields),
+    )
+    return record, clean
+
+class TextBuffer:
+    """Vários textos guardados num único str contíguo + offsets."""
+
+    def __init__(self, texts: List[str]):
+        self._offsets = array("Q", [0])
+        for t in texts:
+            self._offsets.append(self._offsets[-1] + len(t))
+        self._data = "".join(texts)
+
+    def __getitem__(self, i: int) -> str:
+        return self._data[self._offsets[i]:self._offsets[i + 1]]
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+# -------------------------
+# Índice de títulos (autocomplete)
+# - prefixo: busca binária sobre os títulos normalizados ordenados
+# - meio do título: trigramas -> ids, interseção a partir da lista menor
+# - 1-2 letras no meio: unigramas/bigramas -> ids já na ordem de resposta
+# - reconstruído inteiro a cada snapshot (ver GrimorioSnapshot)
+# -------------------------
+AUTOCOMPLETE_LIMIT = 25  # máximo de opções que o Discord aceita
+
+SUGGEST_LIMIT = 3
+SUGGEST_MIN_RATIO = 0.6
+
+class TitleIndex:
+    def __init__(self, titles: List[str]):
+        self.norms = [normalize_query(t) for t in titles]
+        # título normalizado -> id (o primeiro vence; os repetidos ficam em collisions)
+        self.by_norm: Dict[str, int] = {}
+        self.collisions: Dict[str, List[int]] = {}
+        for i, n in enumerate(self.norms):
+            if n in self.by_norm:
+                self.collisions.setdefault(n, [self.by_norm[n]]).append(i)
+            else:
+                self.by_norm[n] = i
+        pairs = sorted((n, i) for i, n in enumerate(self.norms))
+        self._sorted_norms = [n for n, _ in pairs]
+        self.sorted_ids = [i for _, i in pairs]  # ordem alfabética (empate: menor id)
+        # ordem alfabética sem títulos repetidos (/listar todas usa direto)
+        self.unique_sorted_ids = tuple(i for i in self.sorted_ids if self.by_norm[self.norms[i]] == i)
+        self._trigrams: Dict[str, set] = {}
+        for i, n in enumerate(self.norms):
+            for g in {n[j:j+3] for j in range(len(n) - 2)}:
+                self._trigrams.setdefault(g, set()).add(i)
+        # unigramas/bigramas na mesma ordem do caminho por trigramas (posição do trecho,
+        # depois alfabética): chave inteira posição * N + posição em sorted_ids
+        total = len(self.norms)
+        short: Dict[str, list] = {}
+        for rank, i in enumerate(self.sorted_ids):
+            n = self.norms[i]
+            # primeira ocorrência de cada unigrama/bigrama; posição 0 já sai pelo prefixo
+            first: Dict[str, int] = {}
+            for j in range(len(n) - 1, 0, -1):
+                first[n[j]] = j
+                first[n[j:j+2]] = j
+            for g, at in first.items():
+                short.setdefault(g, []).append(at * total + rank)
+        ids = self.sorted_ids
+        self._short: Dict[str, array] = {}
+        for g, keys in short.items():
+            keys.sort()
+            self._short[g] = array("l", [ids[k % total] for k in keys])
+
+    def search(self, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[int]:
+        """
+        Retorna ids (posições em GRIMORIO.magias) dos títulos que contêm query.
+        Quem começa com query vem primeiro (ordem alfabética); depois os que
+        contêm no meio, pela posição do trecho encontrado.
+        """
+        q = normalize_query(query)
+        if not q:
+            return list(range(min(limit, len(self.norms))))
+        out = []
+        pos = bisect_left(self._sorted_norms, q)
+        while pos < len(self._sorted_norms) and self._sorted_norms[pos].startswith(q):
+            out.append(self.sorted_ids[pos])
+            if len(out) >= limit:
+                return out
+            pos += 1
+        prefixed = set(out)
+
+        if len(q) < 3:
+            # 1-2 letras: lista pronta; só anda até completar o limite
+            for i in self._short.get(q, ()):
+                if i not in prefixed:
+                    out.append(i)
+                    if len(out) >= limit:
+                        break
+            return out
+
+        postings = []
+        for j in range(len(q) - 2):
+            ids = self._trigrams.get(q[j:j+3])
+            if not ids:
+                return out
+            postings.append(ids)
+        postings.sort(key=len)
+        cands = set(postings[0])
+        for ids in postings[1:]:
+            cands &= ids
+        hits = []
+        for i in cands:
+            if i in prefixed:
+                continue
+            at = self.norms[i].find(q)
+            if at > 0:
+                hits.append((at, self.norms[i], i))
+        hits.sort()
+        out.extend(i for _, _, i in hits[:limit - len(out)])
+        return out
+
+    def lookup(self, name: str) -> Optional[int]:
+        return self.by_norm.get(normalize_query(name))
+
+    def suggest(self, name: str, limit: int = SUGGEST_LIMIT) -> List[int]:
+        """
+        "Você quis dizer": candidatos que dividem trigramas com name,
+        reordenados por similaridade (difflib) só entre os melhores.
+        """
+        q = normalize_query(name)
+        if len(q) < 3:
+            return self.search(q, limit) if q else []
+        shared: Dict[int, int] = {}
+        for g in {q[j:j+3] for j in range(len(q) - 2)}:
+            for i in self._trigrams.get(g, ()):
+                shared[i] = shared.get(i, 0) + 1
+        # só os mais promissores: nada de ordenar todo mundo que divide um trigrama comum
+        best = heapq.nlargest(limit * 8, shared, key=shared.get)
+        scored = []
+        for i in best:
+            ratio = SequenceMatcher(None, q, self.norms[i]).ratio()
+            if ratio >= SUGGEST_MIN_RATIO:
+                scored.append((-ratio, self.norms[i], i))
+        scored.sort()
+        return [i for _, _, i in scored[:limit]]
+
+# -------------------------
+# Índice invertido (/buscar)
+# - termos de título, categorias e descrição limpa, com peso por campo
+# - ranking BM25; termo da consulta também casa com termos que começam por ele
+# - elemento -> magias já separado para as buscas por elemento
+# -------------------------
+SEARCH_FIELD_WEIGHTS = (3, 2, 1)  # título, categorias, descrição
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+SEARCH_PREFIX_WEIGHT = 0.8        # "telep" -> "teleporte" vale um pouco menos que o termo exato
+SEARCH_MAX_EXPANSIONS = 50
+
+ELEMENTOS_BUSCA = {normalize_query(e) for e in ELEMENTOS_VALIDOS}
+
+class SearchIndex:
+    """
+    Pode ser montado de uma vez (SearchIndex(magias, textos)) ou aos poucos:
+    SearchIndex() + add(magia, texto) por entrada + finish() no fim.
+    """
+
+    def __init__(self, magias: Optional[List[Spell]] = None, texts: Optional[List[str]] = None):
+        self._building: Dict[str, Dict[int, int]] = {}
+        self.doc_len: List[int] = []
+        self.sort_keys: List[str] = []
+        self.by_element: Dict[str, List[int]] = {}
+        self.by_category_term: Dict[str, List[int]] = {}
+        self.by_title_term: Dict[str, List[int]] = {}
+        if magias is not None:
+            for i, m in enumerate(magias):
+                self.add(m, texts[i] if texts else "")
+            self.finish()
 
-    return desc_base, efeito, custo, cooldown, duracao, lista_lim, notas, final_imgs
+    def add(self, m: Spell, text: str = ""):
+        i = len(self.doc_len)
+        postings = self._building
+        fields = (m.title, " ".join(m.categories), text)
+        dl = 0
+        for field, w in zip(fields, SEARCH_FIELD_WEIGHTS):
+            for tok in tokenize(field):
+                d = postings.setdefault(tok, {})
+                d[i] = d.get(i, 0) + w
+                dl += w
+        self.doc_len.append(dl)
+        self.sort_keys.append(normalize_query(m.title))
+        el = normalize_query(m.element)
+        if el:
+            self.by_element.setdefault(el, []).append(i)
+        for tok in set(tokenize(fields[1])):
+            self.by_category_term.setdefault(tok, []).append(i)
+        for tok in set(tokenize(fields[0])):
+            self.by_title_term.setdefault(tok, []).append(i)
+
+    def finish(self):
+        self.n_docs = len(self.doc_len)
+        self.avg_len = (sum(self.doc_len) / self.n_docs) if self.n_docs else 1.0
+        self.postings = {t: list(d.items()) for t, d in self._building.items()}
+        self.vocab = sorted(self.postings)
+        self._building = {}
+
+    def is_element(self, norm: str) -> bool:
+        return bool(norm) and (norm in self.by_element or norm in ELEMENTOS_BUSCA)
+
+    def element_search(self, norm: str) -> List[int]:
+        """Elemento exato primeiro; depois categoria e título com esse termo (ordem alfabética em cada grupo)."""
+        out = []
+        seen = set()
+        for group in (self.by_element, self.by_category_term, self.by_title_term):
+            ids = sorted((i for i in group.get(norm, []) if i not in seen), key=lambda i: self.sort_keys[i])
+            out.extend(ids)
+            seen.update(ids)
+        return out
+
+    def _expand(self, tok: str) -> List[Tuple[str, float]]:
+        terms = []
+        pos = bisect_left(self.vocab, tok)
+        while pos < len(self.vocab) and self.vocab[pos].startswith(tok) and len(terms) < SEARCH_MAX_EXPANSIONS:
+            t = self.vocab[pos]
+            terms.append((t, 1.0 if t == tok else SEARCH_PREFIX_WEIGHT))
+            pos += 1
+        return terms
+
+    def search(self, query: str) -> List[int]:
+        """Ids que contêm todos os termos da consulta, do mais relevante para o menos."""
+        toks = list(dict.fromkeys(tokenize(query)))
+        if not toks:
+            norm = normalize_query(query)
+            toks = [norm] if norm else []
+        if not toks:
+            return []
+        scores: Optional[Dict[int, float]] = None
+        for tok in toks:
+            tok_scores: Dict[int, float] = {}
+            for term, boost in self._expand(tok):
+                plist = self.postings[term]
+                idf = math.log(1 + (self.n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+                for i, tf in plist:
+                    norm_len = 1 - SEARCH_BM25_B + SEARCH_BM25_B * self.doc_len[i] / self.avg_len
+                    sc = boost * idf * tf * (SEARCH_BM25_K1 + 1) / (tf + SEARCH_BM25_K1 * norm_len)
+                    if sc > tok_scores.get(i, 0.0):
+                        tok_scores[i] = sc
+            if scores is None:
+                scores = tok_scores
+            else:
+                scores = {i: sc + tok_scores[i] for i, sc in scores.items() if i in tok_scores}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda i: (-scores[i], self.sort_keys[i]))
+
+# -------------------------
+# Índice de filtros (/listar)
+# - cada elemento e cada categoria distinta vira um bitset (int do Python) com um
+#   bit por magia, na ordem alfabética dos títulos (bit 0 = primeiro título)
+# - filtros combinados ("fogo AND suprema", "NOT arcano", "agua OR gelo") viram
+#   operações de bits; o custo não depende do texto das categorias
+# -------------------------
+# só em maiúsculas: "fogo e gelo" continua sendo um termo só
+FILTER_OPERATORS = {"AND": "and", "E": "and", "OR": "or", "OU": "or", "NOT": "not", "NÃO": "not", "NAO": "not"}
+
+def parse_filter(expr: str) -> List[List[Tuple[bool, str]]]:
+    """
+    Filtro combinado -> OR de cláusulas AND; cada termo pode vir negado (NOT > AND > OR).
+    Operadores só em maiúsculas: AND/E, OR/OU, NOT/NÃO.
+    Palavras seguidas sem operador formam um termo só. ValueError se malformado
+    (inclusive operador no começo/fim ou dois AND/OR seguidos).
+    """
+    clauses: List[List[Tuple[bool, str]]] = [[]]
+    words: List[str] = []
+    negated = False
+    want_term = True  # começo ou logo depois de um operador
+
+    def flush():
+        nonlocal negated
+        if not words:
+            return
+        term = normalize_query(" ".join(words))
+        if not term:
+            raise ValueError(f"termo inválido: {' '.join(words)!r}")
+        clauses[-1].append((negated, term))
+        words.clear()
+        negated = False
+
+    for w in expr.split():
+        op = FILTER_OPERATORS.get(w)
+        if op is None:
+            words.append(w)
+            want_term = False
+            continue
+        if op != "not" and want_term:
+            raise ValueError(f"{w} sem termo antes")
+        flush()
+        if op == "or":
+            clauses.append([])
+        elif op == "not":
+            negated = not negated
+        want_term = True
+    if want_term:
+        raise ValueError("operador sem termo depois" if expr.split() else "filtro vazio")
+    flush()
+    return clauses
+
+class FilterIndex:
+    __slots__ = ("order", "all_mask", "elements", "categories")
+
+    def __init__(self, magias, title_index: "TitleIndex"):
+        n = len(magias)
+        self.order = array("i", title_index.sorted_ids)  # bit -> id
+        self.all_mask = (1 << n) - 1
+        by_element: Dict[str, List[int]] = {}
+        by_category: Dict[str, List[int]] = {}
+        for pos, i in enumerate(self.order):
+            m = magias[i]
+            by_element.setdefault(normalize_query(m.element), []).append(pos)
+            for c in m.categories:
+                by_category.setdefault(normalize_query(c), []).append(pos)
+        self.elements = {k: self._bitset(v, n) for k, v in by_element.items() if k}
+        self.categories = {k: self._bitset(v, n) for k, v in by_category.items() if k}
+
+    @staticmethod
+    def _bitset(positions: List[int], n: int) -> int:
+        raw = bytearray((n + 7) // 8)
+        for p in positions:
+            raw[p >> 3] |= 1 << (p & 7)
+        return int.from_bytes(raw, "little")
+
+    def term_mask(self, term: str) -> int:
+        """Elemento exato ou categoria que contém o termo ("supre" casa "suprema")."""
+        if term == "todas":
+            return self.all_mask
+        mask = self.elements.get(term, 0)
+        for cat, bits in self.categories.items():
+            if term in cat:
+                mask |= bits
+        return mask
+
+    def evaluate(self, clauses: List[List[Tuple[bool, str]]]) -> int:
+        result = 0
+        for clause in clauses:
+            mask = self.all_mask
+            for negated, term in clause:
+                bits = self.term_mask(term)
+                mask = mask & ~bits if negated else mask & bits
+            result |= mask
+        return result
+
+    def ids(self, mask: int, norms: List[str]) -> List[int]:
+        """Ids do mask em ordem alfabética, sem títulos repetidos (fica o de menor id)."""
+        bits = format(mask, "b")[::-1]  # bit 0 primeiro
+        order = self.order
+        out = []
+        last = None
+        pos = bits.find("1")
+        while pos >= 0:
+            i = order[pos]
+            if norms[i] != last:
+                out.append(i)
+                last = norms[i]
+            pos = bits.find("1", pos + 1)
+        return out
 
 # -------------------------
 # Carregar JSON (compatível com blocos)
+# - build_snapshot lê o arquivo em streaming e monta lista + índices sem tocar em nada global
+# - publish_snapshot troca o GRIMORIO inteiro de uma vez: quem leu o anterior
+#   continua com ele, quem chega depois já vê o novo (nunca um meio-termo)
+# - reload_spells faz o build numa thread, fora do event loop
+# -------------------------
+JSON_FILE = os.environ.get("GRIMORIO_FILE", "grimorio_completo.json")  # também aceita NDJSON (uma magia ou bloco por linha)
+STREAM_CHUNK_SIZE = 64 * 1024          # leitura incremental do arquivo (caracteres)
+# guarda o texto limpo das descrições no snapshot (TextBuffer); os comandos não precisam dele
+GRIMORIO_KEEP_TEXT = os.environ.get("GRIMORIO_KEEP_TEXT", "0") == "1"
+GRIMORIO_WATCH_INTERVAL = float(os.environ.get("GRIMORIO_WATCH_INTERVAL", "0"))  # s; 0 = sem auto-reload
+GRIMORIO_WATCH_DEBOUNCE = 2.0  # espera o arquivo parar de mudar antes de recarregar (s)
+
+class GrimorioSnapshot:
+    """Versão imutável do grimório: magias + índices, com número de versão e tempo de carga."""
+    __slots__ = ("version", "path", "mtime", "magias", "texts", "title_index", "search_index", "filter_index",
+                 "loaded_at", "load_seconds")
+
+    def __init__(self, magias, texts=None, path="", mtime=0.0, load_seconds=0.0, version=0,
+                 search_index: Optional[SearchIndex] = None):
+        self.version = version
+        self.path = path
+        self.mtime = mtime
+        self.magias = tuple(magias)
+        self.texts = TextBuffer(texts) if (GRIMORIO_KEEP_TEXT and texts) else None
+        self.title_index = TitleIndex([m.title for m in self.magias])
+        self.search_index = search_index if search_index is not None else SearchIndex(self.magias, texts)
+        self.filter_index = FilterIndex(self.magias, self.title_index)
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+
+GRIMORIO = GrimorioSnapshot([])
+_snapshot_version = 0
+_reload_lock: Optional[asyncio.Lock] = None
+
+def normalize_spell(m: dict) -> Tuple[Spell, str]:
+    title = m.get("title") or m.get("titulo") or m.get("name") or m.get("nome") or "Sem título"
+    raw_elem = m.get("element") or m.get("elemento") or m.get("tipo") or ""
+    elem_clean, icon = get_element_icon(raw_elem)
+    desc = m.get("description") or m.get("descricao") or m.get("desc") or ""
+    cats = m.get("categories") or m.get("categorias") or m.get("tags") or []
+    cats_norm = [clean_str(x).capitalize() for x in cats] if cats else []
+    # explicit limitations if present in object
+    explicit_limits = []
+    for k in ("limitations","limitacoes","limitações","restricoes","restrições"):
+        if k in m and m[k]:
+            v = m[k]
+            if isinstance(v, list):
+                explicit_limits.extend([str(x).strip() for x in v if str(x).strip()])
+            else:
+                explicit_limits.append(str(v).strip())
+    return parse_spell({
+        "title": title,
+        "element_raw": raw_elem,
+        "element": elem_clean,
+        "icon": icon,
+        "description": desc,
+        "categories": cats_norm,
+        "explicit_limits": explicit_limits,
+    })
+
+_JSON_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+def iter_json_items(f, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Lê valores JSON um a um do arquivo aberto f: os itens de um array de topo ([...])
+    ou valores soltos em sequência (NDJSON, um objeto por linha).
+    Só o item atual (mais um pedaço de leitura) fica em memória.
+    No array, os itens precisam vir separados por exatamente uma vírgula
+    (arquivo corrompido falha a carga em vez de virar menos magias).
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    want = chunk_size
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        data = f.read(want)
+        if not data:
+            eof = True
+            return False
+        buf = buf[pos:] + data
+        pos = 0
+        return True
+
+    def skip(chars: str):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or not more():
+                return
+
+    blanks = " \t\r\n"
+    skip(blanks + "\ufeff")
+    in_array = pos < len(buf) and buf[pos] == "["
+    if in_array:
+        pos += 1
+    first = True
+    while True:
+        skip(blanks)
+        if pos >= len(buf):
+            if in_array:
+                raise ValueError("JSON terminou antes do ']'")
+            return
+        if in_array:
+            if buf[pos] == "]":
+                return
+            if not first:
+                if buf[pos] != ",":
+                    raise ValueError(f"JSON inválido: falta ',' entre os itens do array (perto de {buf[pos:pos + 20]!r})")
+                pos += 1
+                skip(blanks)
+                if pos >= len(buf):
+                    raise ValueError("JSON terminou antes do ']'")
+            if buf[pos] in ",]":
+                raise ValueError("JSON inválido: vírgula sobrando no array")
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # objeto/string cortado falha aqui, mas número cortado decodifica pela metade
+                # ("123" + "45", "1.5" + "e10"): só aceita com o número já terminado ou no fim
+                if eof or (end < len(buf) and not (type(value) in (int, float) and buf[end] in _JSON_NUMBER_CHARS)):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # item maior que o buffer: lê o dobro, para não reprocessar o item O(n²) vezes
+            want = max(chunk_size, len(buf) - pos)
+            more()
+        want = chunk_size
+        pos = end
+        first = False
+        yield value
+
+def iter_spell_objects(path=JSON_FILE):
+    """
+    Magias cruas do arquivo, uma por vez, em qualquer um dos formatos:
+    lista de magias, lista de blocos {"element", "magias": [...]}, ou NDJSON de magias/blocos.
+    No formato em blocos a unidade de leitura é o bloco.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for item in iter_json_items(f):
+            if not isinstance(item, dict):
+                continue
+            if "magias" in item:
+                bloco_elem = item.get("element") or item.get("elemento") or ""
+                for m in item.get("magias") or []:
+                    if not isinstance(m, dict):
+                        continue
+                    if not m.get("element"):
+                        m["element"] = bloco_elem
+                    yield m
+            else:
+                yield item
+
+def build_snapshot(path=JSON_FILE) -> GrimorioSnapshot:
+    """
+    Lê o arquivo em streaming e monta um snapshot novo (ainda sem versão).
+    Cada magia é normalizada e vai direto para o índice; erros de leitura sobem.
+    """
+    t0 = time.perf_counter()
+    mtime = os.path.getmtime(path)
+    magias = []
+    kept_texts = [] if GRIMORIO_KEEP_TEXT else None
+    search_index = SearchIndex()
+    for m in iter_spell_objects(path):
+        record, text = normalize_spell(m)
+        magias.append(record)
+        search_index.add(record, text)
+        if kept_texts is not None:
+            kept_texts.append(text)
+    search_index.finish()
+    snap = GrimorioSnapshot(magias, kept_texts, path=path, mtime=mtime, search_index=search_index)
+    snap.load_seconds = time.perf_counter() - t0
+    return snap
+
+# -------------------------
+# Snapshot binário (partida rápida)
+# - o snapshot pronto (registros + índices) vai para um pickle local
+# - a chave é o hash do JSON + o hash deste arquivo .py: mudou o grimório
+#   ou o código de parse, o cache é ignorado e refeito
 # -------------------------
-JSON_FILE = "grimorio_completo.json"
-MAGIAS = []
+SNAPSHOT_CACHE_FILE = os.environ.get("SNAPSHOT_CACHE_FILE", "grimorio_snapshot.pickle")  # "" desliga
+_SNAPSHOT_MAGIC = b"GRIMSNAP1\n"
+SNAPSHOT_PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
 
-def load_spells(path=JSON_FILE):
-    global MAGIAS
-    MAGIAS = []
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def snapshot_cache_key(path: str) -> str:
+    """
+    JSON + código do bot + ambiente: o pickle guarda discord.Embed (com __slots__) e os índices,
+    então trocar de discord.py, de Python ou de protocolo do pickle também invalida o cache.
+    """
+    code = _file_digest(__file__) if os.path.exists(__file__) else ""
+    runtime = f"discord{discord.__version__}:py{sys.version_info[0]}.{sys.version_info[1]}:p{SNAPSHOT_PICKLE_PROTOCOL}"
+    return f"{_file_digest(path)}:{code}:{int(GRIMORIO_KEEP_TEXT)}:{runtime}"
+
+def read_snapshot_cache(key: str, cache_path: str = SNAPSHOT_CACHE_FILE) -> Optional[GrimorioSnapshot]:
+    """Snapshot do cache se a chave bater; None se não existir, for de outra versão ou estiver corrompido."""
+    if not cache_path:
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            if f.readline() != _SNAPSHOT_MAGIC or f.readline().decode().strip() != key:
+                return None
+            snap = pickle.load(f)  # arquivo local gerado pelo próprio bot
+    except Exception:
+        return None
+    return snap if isinstance(snap, GrimorioSnapshot) else None
+
+def write_snapshot_cache(snap: GrimorioSnapshot, key: str, cache_path: str = SNAPSHOT_CACHE_FILE):
+    if not cache_path:
+        return
+    tmp = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_SNAPSHOT_MAGIC)
+            f.write(key.encode() + b"\n")
+            pickle.dump(snap, f, protocol=SNAPSHOT_PICKLE_PROTOCOL)
+        os.replace(tmp, cache_path)  # troca atômica: nunca fica um cache pela metade
+    except Exception as e:
+        print("⚠️ Não foi possível gravar o snapshot:", e)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def load_or_build_snapshot(path=JSON_FILE) -> GrimorioSnapshot:
+    """Usa o snapshot binário quando ele é do mesmo JSON/código; senão monta do JSON e grava o cache."""
+    t0 = time.perf_counter()
+    key = snapshot_cache_key(path) if SNAPSHOT_CACHE_FILE else ""
+    snap = read_snapshot_cache(key) if key else None
+    if snap is not None:
+        snap.path = path
+        snap.mtime = os.path.getmtime(path)
+        snap.load_seconds = time.perf_counter() - t0
+        print(f"⚡ Snapshot binário usado ({SNAPSHOT_CACHE_FILE})")
+        return snap
+    snap = build_snapshot(path)
+    if key:
+        write_snapshot_cache(snap, key)
+    return snap
+
+def publish_snapshot(snap: GrimorioSnapshot) -> GrimorioSnapshot:
+    global GRIMORIO, _snapshot_version
+    _snapshot_version += 1
+    snap.version = _snapshot_version
+    GRIMORIO = snap
+    print(f"✅ Magias carregadas: {len(snap.magias)} (v{snap.version}, {snap.load_seconds * 1000:.0f} ms)")
+    collisions = snap.title_index.collisions
+    for norm, ids in list(collisions.items())[:10]:
+        print(f"⚠️ Título repetido: {snap.magias[ids[0]].title!r} ×{len(ids)} — /magia usa o primeiro")
+    if len(collisions) > 10:
+        print(f"⚠️ ... e mais {len(collisions) - 10} títulos repetidos")
+    return snap
+
+def load_spells(path=JSON_FILE) -> Optional[GrimorioSnapshot]:
+    """Carga síncrona (partida, numa thread). Em erro mantém o grimório atual e retorna None."""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        return publish_snapshot(load_or_build_snapshot(path))
     except Exception as e:
         print("❌ Erro ao abrir JSON:", e)
-        return
+        return None
 
-    def normalize(m):
-        title = m.get("title") or m.get("titulo") or m.get("name") or m.get("nome") or "Sem título"
-        raw_elem = m.get("element") or m.get("elemento") or m.get("tipo") or ""
-        elem_clean, icon = get_element_icon(raw_elem)
-        desc = m.get("description") or m.get("descricao") or m.get("desc") or ""
-        cats = m.get("categories") or m.get("categorias") or m.get("tags") or []
-        cats_norm = [clean_str(x).capitalize() for x in cats] if cats else []
-        # explicit limitations if present in object
-        explicit_limits = []
-        for k in ("limitations","limitacoes","limitações","restricoes","restrições"):
-            if k in m and m[k]:
-                v = m[k]
-                if isinstance(v, list):
-                    explicit_limits.extend([str(x).strip() for x in v if str(x).strip()])
-                else:
-                    explicit_limits.append(str(v).strip())
-        return {
-            "title": title,
-            "element_raw": raw_elem,
-            "element": elem_clean,
-            "icon": icon,
-            "description": desc,
-            "categories": cats_norm,
-            "explicit_limits": explicit_limits,
-            "_orig": m
-        }
-
-    if isinstance(data, list) and data and isinstance(data[0], dict) and "magias" in data[0]:
-        for bloco in data:
-            bloco_elem = bloco.get("element") or bloco.get("elemento") or ""
-            for m in bloco.get("magias", []):
-                if not m.get("element"):
-                    m["element"] = bloco_elem
-                MAGIAS.append(normalize(m))
-    else:
-        if isinstance(data, list):
-            for m in data:
-                if isinstance(m, dict):
-                    MAGIAS.append(normalize(m))
-    print(f"✅ Magias carregadas: {len(MAGIAS)}")
+async def reload_spells(path=None) -> GrimorioSnapshot:
+    """Recarrega numa thread e publica no loop. Recargas simultâneas ficam em fila. Erros sobem."""
+    global _reload_lock
+    if _reload_lock is None:
+        _reload_lock = asyncio.Lock()
+    async with _reload_lock:
+        loop = asyncio.get_running_loop()
+        snap = await loop.run_in_executor(None, load_or_build_snapshot, path or GRIMORIO.path or JSON_FILE)
+        publish_snapshot(snap)
+        RESPONSE_CACHE.clear()
+        start_media_prewarm(snap)
+        return snap
 
-# load at start
-load_spells()
+async def watch_grimorio_file(interval: float = GRIMORIO_WATCH_INTERVAL, debounce: float = GRIMORIO_WATCH_DEBOUNCE):
+    """
+    Recarrega sozinho quando o mtime do JSON muda e fica parado por `debounce` segundos.
+    Se a recarga falhar, aquela versão do arquivo não é tentada de novo: só a próxima mudança.
+    """
+    seen_mtime = None
+    failed_mtime = None
+    changed_at = 0.0
+    while True:
+        await asyncio.sleep(interval)
+        path = GRIMORIO.path or JSON_FILE
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        if mtime == GRIMORIO.mtime or mtime == failed_mtime:
+            seen_mtime = None
+            continue
+        if mtime != seen_mtime:
+            seen_mtime, changed_at = mtime, time.monotonic()
+            continue
+        if time.monotonic() - changed_at < debounce:
+            continue
+        try:
+            await reload_spells(path)
+            failed_mtime = None
+        except Exception as e:
+            print("❌ Auto-reload falhou (espera o arquivo mudar de novo):", e)
+            failed_mtime = mtime
+        seen_mtime = None
+
+# -------------------------
+# Paginação de resultados (/buscar, /listar)
+# - o resultado é guardado como tupla dos títulos (os mesmos str das magias, sem cópia);
+#   só a página atual vira texto
+# - nada de referência ao snapshot: depois de um reload o grimório antigo pode ser liberado
+#   mesmo com botões de páginas antigas ainda valendo
+# - estado das páginas em PAGE_STORE: limitado e com expiração
+# - botões são DynamicItem: o custom_id leva token + página, nenhuma View fica em memória
+# -------------------------
+PAGE_SIZE = 20
+PAGE_TTL = 15 * 60        # depois disso os botões respondem "lista expirada" (s)
+PAGE_STORE_MAX = 2000
+
+class TTLCache:
+    """Dicionário LRU com expiração por entrada e contadores de hit/miss."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[object, Tuple[float, object]]" = OrderedDict()
+
+    def get(self, key):
+        item = self._entries.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def drop(self, predicate) -> int:
+        """Remove as entradas cuja chave satisfaz predicate; devolve quantas saíram."""
+        keys = [k for k in self._entries if predicate(k)]
+        for k in keys:
+            del self._entries[k]
+        return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+class ResultPages:
+    __slots__ = ("titles", "title", "color")
+
+    def __init__(self, titles: Tuple[str, ...], title: str, color: discord.Color):
+        self.titles = titles
+        self.title = title
+        self.color = color
+
+    def page_count(self) -> int:
+        return max(1, -(-len(self.titles) // PAGE_SIZE))
+
+    def render(self, page: int) -> discord.Embed:
+        page = min(max(page, 0), self.page_count() - 1)
+        chunk = self.titles[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+        text = "\n".join(f"• {t}" for t in chunk)
+        embed = discord.Embed(title=self.title, description=text, color=self.color)
+        if self.page_count() > 1:
+            embed.set_footer(text=f"Página {page + 1}/{self.page_count()}")
+        return embed
+
+PAGE_STORE = TTLCache(PAGE_STORE_MAX, PAGE_TTL)
+
+class PageButton(discord.ui.DynamicItem[discord.ui.Button], template=r"grimorio:pg:(?P<token>[0-9a-f]+):(?P<page>\d+)"):
+    def __init__(self, token: str, page: int, label: str = "", disabled: bool = False):
+        super().__init__(discord.ui.Button(
+            label=label, style=discord.ButtonStyle.secondary, disabled=disabled,
+            custom_id=f"grimorio:pg:{token}:{page}",
+        ))
+        self.token = token
+        self.page = page
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(match["token"], int(match["page"]), item.label or "")
+
+    async def callback(self, interaction: discord.Interaction):
+        pages = PAGE_STORE.get(self.token)
+        if pages is None:
+            return await interaction.response.send_message("⌛ Esta lista expirou; use o comando de novo.", ephemeral=True)
+        await interaction.response.edit_message(embed=pages.render(self.page), view=build_page_view(self.token, pages, self.page))
+
+def build_page_view(token: str, pages: ResultPages, page: int) -> discord.ui.View:
+    last = pages.page_count() - 1
+    page = min(max(page, 0), last)
+    view = discord.ui.View(timeout=None)
+    view.add_item(PageButton(token, max(page - 1, 0), "◀", disabled=page == 0))
+    view.add_item(PageButton(token, min(page + 1, last), "▶", disabled=page == last))
+    view.stop()  # quem responde é o DynamicItem registrado no bot; a View não precisa ficar guardada
+    return view
+
+class RenderedPages:
+    """Primeira página pronta para enviar (embed + botões); reaproveitável pelo cache de respostas."""
+    __slots__ = ("pages", "embed", "view", "token")
+
+    def __init__(self, pages: ResultPages, embed: discord.Embed, view: Optional[discord.ui.View], token: Optional[str]):
+        self.pages = pages
+        self.embed = embed
+        self.view = view
+        self.token = token
+
+def render_result_pages(snap: "GrimorioSnapshot", ids, title: str, color: discord.Color) -> RenderedPages:
+    with span("render", results=len(ids)):
+        magias = snap.magias
+        pages = ResultPages(tuple(magias[i].title for i in ids), title, color)
+        token = view = None
+        if pages.page_count() > 1:
+            token = secrets.token_hex(6)
+            PAGE_STORE.put(token, pages)
+            view = build_page_view(token, pages, 0)
+        return RenderedPages(pages, pages.render(0), view, token)
+
+async def send_result_pages(interaction: discord.Interaction, rendered: RenderedPages):
+    if rendered.token is not None:
+        # resposta vinda do cache: os botões continuam valendo enquanto ela for usada
+        PAGE_STORE.put(rendered.token, rendered.pages)
+    with span("send"):
+        if rendered.view is None:
+            return await interaction.response.send_message(embed=rendered.embed)
+        await interaction.response.send_message(embed=rendered.embed, view=rendered.view)
+
+def unique_by_title(snap: "GrimorioSnapshot", ids) -> List[int]:
+    """Remove ids com o mesmo título normalizado, preservando a ordem."""
+    norms = snap.title_index.norms
+    seen = set()
+    out = []
+    for i in ids:
+        if norms[i] not in seen:
+            out.append(i); seen.add(norms[i])
+    return out
+
+# -------------------------
+# Cache de respostas (/magia, /buscar, /listar)
+# - chave: (comando, argumento normalizado, versão do grimório); o reload troca a
+#   versão e limpa o cache (as entradas seguram o snapshot antigo)
+# - guarda o que vai pronto para o Discord: embeds, botões de página, sugestões
+# - o /magia só guarda imagens se todas foram resolvidas (falha volta a ser tentada)
+# -------------------------
+RESPONSE_CACHE_MAX = int(os.environ.get("RESPONSE_CACHE_MAX", "1024"))  # 0 desliga
+RESPONSE_CACHE_TTL = 60 * 60  # s
+RESPONSE_CACHE = TTLCache(RESPONSE_CACHE_MAX, RESPONSE_CACHE_TTL)
+RESPONSE_CACHE_RESULTS = Counter()  # (comando, "hit"/"miss") -> total
+NO_RESULTS = ()  # resposta "nada encontrado" guardada no cache (None = não está no cache)
+
+def cached_response(command: str, key, snap: "GrimorioSnapshot"):
+    value = RESPONSE_CACHE.get((command, key, snap.version))
+    RESPONSE_CACHE_RESULTS[(command, "miss" if value is None else "hit")] += 1
+    return value
+
+def store_response(command: str, key, snap: "GrimorioSnapshot", value):
+    RESPONSE_CACHE.put((command, key, snap.version), value)
+
+# -------------------------
+# Limite de uso (token bucket)
+# - um balde por chave (usuário, servidor ou "global"); balde parado tempo
+#   suficiente para encher de novo é descartado, então a memória não cresce
+# - @rate_limited aplica vários escopos de uma vez; só consome se todos liberarem
+# - limites vêm do ambiente como "fichas_por_s,balde" (ex.: RATE_LIMIT_MAGIA_USER="1,3");
+#   vazio ou 0 desliga. Sem configuração só vale o limite antigo do /buscar por usuário
+# - RATE_LIMIT_GLOBAL é por processo: com BOT_PROCESSES=N o teto real é N vezes o valor
+# -------------------------
+RATE_LIMIT_MAX_KEYS = 50000
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: float = 1, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate            # fichas por segundo
+        self.burst = burst          # tamanho do balde
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[object, Tuple[float, float]]" = OrderedDict()  # chave -> (fichas, instante)
+
+    def _evict(self, now: float):
+        refill = self.burst / self.rate
+        while self._buckets:
+            key, (_, last) = next(iter(self._buckets.items()))
+            if now - last < refill and len(self._buckets) <= self.max_keys:
+                break
+            del self._buckets[key]
+
+    def _tokens(self, key, now: float) -> float:
+        item = self._buckets.get(key)
+        if item is None:
+            return float(self.burst)
+        tokens, last = item
+        return min(float(self.burst), tokens + (now - last) * self.rate)
+
+    def retry_after(self, key, now: Optional[float] = None) -> float:
+        """Segundos até ter uma ficha para key (0 = pode agora). Não consome."""
+        now = time.monotonic() if now is None else now
+        tokens = self._tokens(key, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def consume(self, key, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        tokens = self._tokens(key, now) - 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        self._evict(now)
+
+    def __len__(self):
+        return len(self._buckets)
+
+def limiter_from_env(var: str, default: str = "") -> Optional[RateLimiter]:
+    """Lê "fichas_por_s,balde" de var; None (escopo desligado) se vazio ou taxa 0."""
+    raw = os.environ.get(var, default).strip()
+    if not raw:
+        return None
+    rate, _, burst = raw.partition(",")
+    if float(rate) <= 0:
+        return None
+    return RateLimiter(rate=float(rate), burst=float(burst or 1))
+
+THROTTLED = Counter()  # (comando, escopo) -> total de chamadas barradas
+
+# compartilhado por todos os comandos limitados (desligado por padrão)
+GLOBAL_LIMIT = limiter_from_env("RATE_LIMIT_GLOBAL")
+
+def rate_limited(name: str, user: Optional[RateLimiter] = None, guild: Optional[RateLimiter] = None,
+                 everyone: Optional[RateLimiter] = GLOBAL_LIMIT):
+    """Barra o comando com resposta efêmera quando algum dos escopos estourar."""
+    def deco(func):
+        @functools.wraps(func)
+        async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+            now = time.monotonic()
+            checks = []
+            if user is not None:
+                checks.append(("user", user, interaction.user.id))
+            if guild is not None and interaction.guild_id is not None:
+                checks.append(("guild", guild, interaction.guild_id))
+            if everyone is not None:
+                checks.append(("global", everyone, None))
+            for scope, limiter, key in checks:
+                wait = limiter.retry_after(key, now)
+                if wait > 0:
+                    THROTTLED[(name, scope)] += 1
+                    return await interaction.response.send_message(
+                        f"⏳ Aguarde {max(wait, 0.1):.1f}s antes de usar /{name} de novo.", ephemeral=True)
+            for _, limiter, key in checks:
+                limiter.consume(key, now)
+            return await func(interaction, *args, **kwargs)
+        return wrapper
+    return deco
 
 # -------------------------
 # Bot setup
 # -------------------------
-intents = discord.Intents.default()
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Modo com shards (opcional):
+# - BOT_SHARDED=1 usa AutoShardedBot (shards escolhidos pelo Discord ou SHARD_COUNT)
+# - SHARD_IDS="0-3" ou "0,1,2,3" restringe este processo a alguns shards
+# - BOT_PROCESSES=N (com SHARD_COUNT) sobe N processos, cada um com uma faixa de shards
+def _parse_shard_ids(raw: str) -> Optional[List[int]]:
+    if not raw.strip():
+        return None
+    ids = []
+    for part in raw.split(","):
+        a, _, b = part.strip().partition("-")
+        ids.extend(range(int(a), int(b or a) + 1))
+    return ids
+
+BOT_SHARDED = os.environ.get("BOT_SHARDED", "0") == "1"
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = _parse_shard_ids(os.environ.get("SHARD_IDS", ""))
+BOT_PROCESSES = int(os.environ.get("BOT_PROCESSES", "1"))
+LAUNCHER_PID = int(os.environ["GRIMORIO_LAUNCHER_PID"]) if os.environ.get("GRIMORIO_LAUNCHER_PID") else None
+
+SHARD_INTERACTIONS = Counter()  # shard -> interações recebidas
+
+class GrimorioBotMixin:
+    watch_task: Optional[asyncio.Task] = None
+
+    async def setup_hook(self):
+        self.add_dynamic_items(PageButton)
+        if GRIMORIO_WATCH_INTERVAL > 0:
+            self.watch_task = asyncio.create_task(watch_grimorio_file())
+        if LAUNCHER_PID and hasattr(signal, "SIGHUP"):
+            # o launcher repassa SIGHUP quando algum processo recarregou o grimório
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(reload_from_signal()))
+
+    async def close(self):
+        if self.watch_task:
+            self.watch_task.cancel()
+        # fecha o pool HTTP do resolvedor de mídia e o cache em disco junto com o bot
+        await stop_media_prewarm()
+        await close_media_session()
+        media_cache.close()
+        PROFILER.stop()
+        TRACE_EXPORTER.close()
+        await super().close()
+
+    def shard_of(self, guild_id: Optional[int]) -> int:
+        if guild_id is None or not self.shard_count:
+            return 0
+        return (guild_id >> 22) % self.shard_count
+
+class GrimorioBot(GrimorioBotMixin, commands.Bot):
+    pass
+
+class GrimorioShardedBot(GrimorioBotMixin, commands.AutoShardedBot):
+    pass
+
+def make_bot() -> commands.Bot:
+    intents = discord.Intents.default()
+    if not BOT_SHARDED:
+        return GrimorioBot(command_prefix="!", intents=intents)
+    return GrimorioShardedBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+
+async def reload_from_signal():
+    # só recarrega se o arquivo mudou desde o snapshot atual (quem pediu o /reload já está em dia)
+    path = GRIMORIO.path or JSON_FILE
+    try:
+        if os.path.getmtime(path) == GRIMORIO.mtime:
+            return
+        await reload_spells(path)
+    except Exception as e:
+        print("❌ Reload (sinal) falhou:", e)
+
+def broadcast_reload():
+    """Pede ao launcher para avisar todos os processos (SIGHUP)."""
+    if LAUNCHER_PID and hasattr(signal, "SIGHUP"):
+        try:
+            os.kill(LAUNCHER_PID, signal.SIGHUP)
+        except OSError:
+            pass
+
+bot = make_bot()
 bot.synced = False
 
-# per-user debounce (to reduce spam)
-user_search_ts = {}
+@bot.listen("on_interaction")
+async def count_shard_interaction(interaction: discord.Interaction):
+    SHARD_INTERACTIONS[bot.shard_of(interaction.guild_id)] += 1
 
-# Autocomplete
+# Autocomplete (usa o índice do snapshot atual)
+@instrumented("autocomplete")
 async def autocomplete_magias(interaction: discord.Interaction, current: str):
-    norm = normalize_query(current)
-    choices = []
-    for m in MAGIAS:
-        if norm in normalize_query(m["title"]):
-            choices.append(app_commands.Choice(name=m["title"][:100], value=m["title"]))
-        if len(choices) >= 25:
-            break
-    return choices
+    snap = GRIMORIO
+    magias, index = snap.magias, snap.title_index
+    with span("lookup"):
+        return [
+            app_commands.Choice(name=magias[i].title[:100], value=magias[i].title)
+            for i in index.search(current)
+        ]
 
 # -------------------------
 # /magia (defer + followups) — mostra tudo e envia imagens extras
 # -------------------------
 @bot.tree.command(name="magia", description="Consulta detalhes de uma magia.")
 @app_commands.autocomplete(nome=autocomplete_magias)
+@rate_limited("magia", user=limiter_from_env("RATE_LIMIT_MAGIA_USER"), guild=limiter_from_env("RATE_LIMIT_MAGIA_GUILD"))
+@instrumented("magia")
 async def cmd_magia(interaction: discord.Interaction, nome: str):
-    await interaction.response.defer()
-    alvo = None
-    norm = normalize_query(nome)
-    for m in MAGIAS:
-        if normalize_query(m["title"]) == norm:
-            alvo = m; break
-    if not alvo:
-        return await interaction.followup.send(f"❌ Magia **{nome}** não encontrada.", ephemeral=True)
-
-    desc_raw = alvo["description"] or ""
-    desc_base, efeito, custo, cooldown, duracao, lista_lim, notas, imagens = extract_images_and_fields(desc_raw)
-
-    # juntar limitações explícitas + extraídas
-    limits = []
-    if isinstance(alvo.get("explicit_limits"), list):
-        limits.extend([x for x in alvo["explicit_limits"] if x])
-    if lista_lim:
-        limits.extend([x for x in lista_lim if x])
-    # check original object keys as fallback
-    orig = alvo.get("_orig", {})
-    for k in ("limitações","limitacoes","limitations","restricoes","restrições"):
-        v = orig.get(k)
-        if v:
-            if isinstance(v, list):
-                limits.extend([str(x).strip() for x in v if str(x).strip()])
-            else:
-                limits.append(str(v).strip())
-    # dedupe preserving order
-    final_limits = []
-    seen_l = set()
-    for it in limits:
-        if it and it not in seen_l:
-            final_limits.append(it); seen_l.add(it)
-
-    titulo = alvo["title"]
-    icon = alvo["icon"] or "❔"
-    elemento = alvo["element"].capitalize() if alvo["element"] else clean_str(alvo["element_raw"]).capitalize() or "Desconhecido"
-    cats = ", ".join(alvo["categories"]) if alvo["categories"] else "Nenhuma"
-
-    def trunc(t, lim=1024):
-        if not t:
-            return ""
-        t = str(t)
-        return t if len(t) <= lim else t[:lim-3] + "..."
-
-    embed = discord.Embed(title=f"{icon} {titulo}", description=trunc(desc_base) or "Sem descrição.", color=discord.Color.orange())
-    embed.add_field(name="🎯 Efeito", value=trunc(efeito) or "Não informado.", inline=False)
-    if notas:
-        embed.add_field(name="📝 Notas / Extras", value=trunc(notas), inline=False)
-    embed.add_field(name="💧 Custo", value=custo or "?", inline=True)
-    embed.add_field(name="⏳ Cooldown", value=cooldown or "?", inline=True)
-    embed.add_field(name="⌛ Duração", value=duracao or "?", inline=True)
-    embed.add_field(name="⚠️ Limitações", value="\n".join(f"• {l}" for l in final_limits) if final_limits else "Nenhuma.", inline=False)
-    embed.set_footer(text=f"Categorias: {cats} — Elemento: {elemento}")
+    with span("send", call="defer"):
+        await interaction.response.defer()
+    snap = GRIMORIO
+    magias, index = snap.magias, snap.title_index
+    key = normalize_query(nome)
+    with span("lookup") as attrs:
+        cached = cached_response("magia", key, snap)
+        if cached is not None:
+            # (id da magia ou None, sugestões, embeds das imagens ou None se ainda não resolvidas)
+            i, sugestoes, image_embeds = cached
+        else:
+            i = index.lookup(nome)
+            sugestoes = [magias[j].title for j in index.suggest(nome)] if i is None else []
+            image_embeds = None
+        attrs["found"] = i is not None
+        attrs["cached"] = cached is not None
+    if i is None:
+        if cached is None:
+            store_response("magia", key, snap, (None, sugestoes, None))
+        msg = f"❌ Magia **{nome}** não encontrada."
+        if sugestoes:
+            msg += " Você quis dizer: " + ", ".join(f"**{t}**" for t in sugestoes) + "?"
+        with span("send"):
+            return await interaction.followup.send(msg, ephemeral=True)
+    alvo = magias[i]
+
+    # embed e imagens já vêm prontos do load_spells (parse_spell); aqui não há parse
+    embed = alvo.embed
+    if image_embeds is None:
+        imagens = alvo.images[:MAX_IMAGES_SEND]
+        resolved = []
+        if imagens:
+            # resolve todas em paralelo (fora do caminho do loop)
+            with span("resolve", images=len(imagens)):
+                resolved = await resolve_media_many(imagens)
+        image_embeds = build_image_embeds(resolved)
+        # página que voltou como url original = não resolvida; não congela isso no cache
+        complete = not any(u in resolved for u in imagens if not is_direct_media(u))
+        store_response("magia", key, snap, (i, [], image_embeds if complete else None))
 
-    # set first image if available and is valid
-    if imagens:
-        # limit images count
-        imagens = imagens[:MAX_IMAGES_SEND]
-        first = imagens[0]
+    if image_embeds:
+        await send_magia_with_images(interaction, embed, image_embeds)
+    else:
+        # no images: just send embed
+        with span("send"):
+            await interaction.followup.send(embed=embed)
+        STATS["magia_rest_calls"] += 1
+
+def build_image_embeds(imagens: List[str]) -> List[discord.Embed]:
+    with span("render", images=len(imagens)):
+        image_embeds = []
+        for img in imagens:
+            e = discord.Embed(color=discord.Color.orange())
+            e.set_image(url=img)
+            image_embeds.append(e)
+        return image_embeds
+
+async def send_magia_with_images(interaction: discord.Interaction, embed: discord.Embed, image_embeds: List[discord.Embed]):
+    """
+    Envia o embed da magia e os embeds de imagem (build_image_embeds).
+    Em MAGIA_IMAGE_MODE="batch" junta tudo em mensagens de até DISCORD_MAX_EMBEDS embeds;
+    se um lote for recusado, aquele lote volta a ir um embed por mensagem.
+    """
+    with span("send", mode=MAGIA_IMAGE_MODE) as attrs:
+        calls = await _send_magia_embeds(interaction, embed, image_embeds)
+        attrs["calls"] = calls
+
+    STATS["magia_rest_calls"] += calls
+    # referência: o modo "separate" usa 1 chamada + 1 por imagem
+    STATS["magia_rest_calls_saved"] += max(0, 1 + len(image_embeds) - calls)
+
+async def _send_magia_embeds(interaction: discord.Interaction, embed: discord.Embed, image_embeds: List[discord.Embed]) -> int:
+    """Faz as chamadas de envio do /magia; retorna quantas chamadas REST foram feitas."""
+    calls = 0
+    if MAGIA_IMAGE_MODE == "batch":
+        embeds = [embed] + image_embeds
+        for k in range(0, len(embeds), DISCORD_MAX_EMBEDS):
+            lote = embeds[k:k + DISCORD_MAX_EMBEDS]
+            calls += 1
+            try:
+                await interaction.followup.send(embeds=lote)
+                continue
+            except discord.HTTPException:
+                pass
+            for e in lote:
+                calls += 1
+                try:
+                    await interaction.followup.send(embed=e)
+                except Exception:
+                    continue
+    else:
+        calls += 1
         try:
             await interaction.followup.send(embed=embed, wait=True)  # send embed first as followup
         except Exception:
             # fallback: send embed via response if followup fails
+            calls += 1
             await interaction.followup.send(embed=embed)
         # enviar imagens extras: for each image send an embed with image
-        for img in imagens:
+        for e in image_embeds:
+            calls += 1
             try:
-                resolved = try_resolve_media(img) if requests else img
-                if resolved and len(resolved) > 0:
-                    e = discord.Embed(color=discord.Color.orange())
-                    e.set_image(url=resolved)
-                    await interaction.followup.send(embed=e)
+                await interaction.followup.send(embed=e)
             except Exception:
                 continue
-    else:
-        # no images: just send embed
-        await interaction.followup.send(embed=embed)
+    return calls
 
 # -------------------------
 # Inteligent /buscar (modo 3)
 # - if query is element -> search element + categories + title
-# - else -> search title + categories + description
+# - else -> search title + categories + description (ranked, search_index)
 # -------------------------
 @bot.tree.command(name="buscar", description="Busca magias por nome, elemento, categoria ou descrição.")
 @app_commands.describe(term="Elemento (fogo) ou palavra (teleporte)")
+# padrão = o debounce antigo do /buscar: uma busca a cada 0,7 s por usuário
+@rate_limited("buscar", user=limiter_from_env("RATE_LIMIT_BUSCAR_USER", f"{1 / 0.7},1"), guild=limiter_from_env("RATE_LIMIT_BUSCAR_GUILD"))
+@instrumented("buscar")
 async def cmd_buscar(interaction: discord.Interaction, term: str):
-    user = interaction.user.id
-    now = time.time()
-    last = user_search_ts.get(user, 0)
-    if now - last < 0.7:
-        return await interaction.response.send_message("⏳ Aguarde 1s entre buscas.", ephemeral=True)
-    user_search_ts[user] = now
-
     norm = normalize_query(term)
-    results = []
-
-    if norm in ELEMENTOS_VALIDOS:
-        # strict element search
-        for m in MAGIAS:
-            if norm == m["element"]:
-                results.append(m["title"]); continue
-            if norm in normalize_query(" ".join(m["categories"])):
-                results.append(m["title"]); continue
-            if norm in normalize_query(m["title"]):
-                results.append(m["title"]); continue
-    else:
-        # broad search
-        for m in MAGIAS:
-            if (norm in normalize_query(m["title"])
-                or norm in normalize_query(" ".join(m["categories"]))
-                or norm in normalize_query(m["description"])):
-                results.append(m["title"])
-
-    if not results:
-        return await interaction.response.send_message(f"❌ Nenhuma magia encontrada para **{term}**.", ephemeral=True)
+    snap = GRIMORIO
+    index = snap.search_index
+    # "fo go" é elemento (norm) e "fogo, gelo" vira termos (tokenize): a chave leva os dois
+    key = (norm, " ".join(tokenize(term)))
+    rendered = cached_response("buscar", key, snap)
+    if rendered is None:
+        with span("lookup") as attrs:
+            if index.is_element(norm):
+                # strict element search: elemento -> categoria -> título
+                attrs["mode"] = "element"
+                ids = index.element_search(norm)
+            else:
+                # broad search: título + categorias + descrição, por relevância
+                attrs["mode"] = "text"
+                ids = index.search(term)
+            # dedupe preservando o ranking; só a página atual é montada
+            ids = unique_by_title(snap, ids)
+            attrs["results"] = len(ids)
+        rendered = render_result_pages(snap, ids, f"🔍 Resultados ({len(ids)})", discord.Color.blue()) if ids else NO_RESULTS
+        store_response("buscar", key, snap, rendered)
 
-    # dedupe + sort
-    uniq = sorted(set(results))
-    text = "\n".join(f"• {t}" for t in uniq)
-    if len(text) > 4000:
-        text = text[:3990] + "\n... (truncado)"
+    if rendered is NO_RESULTS:
+        with span("send"):
+            return await interaction.response.send_message(f"❌ Nenhuma magia encontrada para **{term}**.", ephemeral=True)
 
-    embed = discord.Embed(title=f"🔍 Resultados ({len(uniq)})", description=text, color=discord.Color.blue())
-    await interaction.response.send_message(embed=embed)
+    await send_result_pages(interaction, rendered)
 
 # -------------------------
 # /listar (elemento / categoria / todas)
 # -------------------------
 @bot.tree.command(name="listar", description="Lista magias por elemento, categoria ou todas.")
-@app_commands.describe(filtro="Ex: fogo, água, suprema, todas")
-async def cmd_listar(interaction: discord.Interaction, filtro: str):
-    norm = normalize_query(filtro)
-    results = []
-    for m in MAGIAS:
-        if norm == "todas":
-            results.append(m["title"]); continue
-        if norm == m["element"]:
-            results.append(m["title"]); continue
-        if norm in normalize_query(" ".join(m["categories"])):
-            results.append(m["title"]); continue
-
-    if not results:
-        return await interaction.response.send_message(f"❌ Nada encontrado para **{filtro}**.", ephemeral=True)
-
-    text = "\n".join(f"• {t}" for t in sorted(set(results)))
-    if len(text) > 4000:
-        text = text[:3990] + "\n... (truncado)"
-    embed = discord.Embed(title=f"📘 Lista ({len(results)}) — {filtro.capitalize()}", description=text, color=discord.Color.green())
-    await interaction.response.send_message(embed=embed)
+@app_commands.describe(filtro="Ex: fogo, água, suprema, todas, fogo AND suprema, NOT arcano",
+                       combinar="Filtro extra combinado com AND (ex: suprema, NOT arcano, agua OR gelo)")
+@rate_limited("listar", user=limiter_from_env("RATE_LIMIT_LISTAR_USER"), guild=limiter_from_env("RATE_LIMIT_LISTAR_GUILD"))
+@instrumented("listar")
+async def cmd_listar(interaction: discord.Interaction, filtro: str, combinar: Optional[str] = None):
+    try:
+        clauses = parse_filter(filtro)
+        extra = parse_filter(combinar) if combinar else None
+    except ValueError as e:
+        return await interaction.response.send_message(f"❌ Filtro inválido: {e}.", ephemeral=True)
+    snap = GRIMORIO
+    label = filtro.capitalize() + (f" + {combinar}" if combinar else "")
+    # o título da lista mostra o filtro como foi digitado (capitalizado); entra na chave
+    key = (repr(clauses), repr(extra), label)
+    rendered = cached_response("listar", key, snap)
+    if rendered is None:
+        with span("lookup") as attrs:
+            if clauses == [[(False, "todas")]] and extra is None:
+                # já vem ordenado e sem repetidos do índice de títulos
+                ids = snap.title_index.unique_sorted_ids
+            else:
+                index = snap.filter_index
+                mask = index.evaluate(clauses)
+                if extra is not None:
+                    mask &= index.evaluate(extra)
+                ids = index.ids(mask, snap.title_index.norms)
+            attrs["results"] = len(ids)
+        rendered = (render_result_pages(snap, ids, f"📘 Lista ({len(ids)}) — {label}", discord.Color.green())
+                    if ids else NO_RESULTS)
+        store_response("listar", key, snap, rendered)
+
+    if rendered is NO_RESULTS:
+        with span("send"):
+            return await interaction.response.send_message(f"❌ Nada encontrado para **{filtro}**.", ephemeral=True)
+
+    await send_result_pages(interaction, rendered)
 
 # -------------------------
 # /reload — recarrega JSON em runtime (owner/manage_guild)
 # -------------------------
-@bot.tree.command(name="reload", description="Recarrega o arquivo grimorio_completo.json (admin/dono).")
-async def cmd_reload(interaction: discord.Interaction):
-    is_owner = await bot.is_owner(interaction.user)
-    has_perm = False
+async def is_admin(interaction: discord.Interaction) -> bool:
+    """Dono do bot ou quem pode gerenciar o servidor."""
+    if await bot.is_owner(interaction.user):
+        return True
     try:
         if interaction.guild:
             member = interaction.guild.get_member(interaction.user.id)
             if member and (member.guild_permissions.manage_guild or member.guild_permissions.administrator):
-                has_perm = True
+                return True
     except Exception:
         pass
-    if not (is_owner or has_perm):
+    return False
+
+@bot.tree.command(name="reload", description="Recarrega o arquivo grimorio_completo.json (admin/dono).")
+@instrumented("reload")
+async def cmd_reload(interaction: discord.Interaction):
+    if not await is_admin(interaction):
         return await interaction.response.send_message("❌ Você não tem permissão para usar /reload.", ephemeral=True)
 
-    load_spells()
-    return await interaction.response.send_message("✅ Grimório recarregado.", ephemeral=True)
+    # leitura + índices rodam numa thread; o snapshot novo entra de uma vez
+    await interaction.response.defer(ephemeral=True)
+    try:
+        with span("load"):
+            snap = await reload_spells()
+    except Exception as e:
+        return await interaction.followup.send(f"❌ Erro ao recarregar: {e}", ephemeral=True)
+    broadcast_reload()
+    return await interaction.followup.send(
+        f"✅ Grimório recarregado: {len(snap.magias)} magias (v{snap.version}, {snap.load_seconds * 1000:.0f} ms).",
+        ephemeral=True,
+    )
+
+# -------------------------
+# /profiler — profiler por amostragem em runtime (owner/manage_guild)
+# -------------------------
+@bot.tree.command(name="profiler", description="Liga/desliga o profiler por amostragem (admin/dono).")
+@app_commands.describe(acao="ligar, desligar ou status")
+@app_commands.choices(acao=[app_commands.Choice(name=a, value=a) for a in ("ligar", "desligar", "status")])
+@instrumented("profiler")
+async def cmd_profiler(interaction: discord.Interaction, acao: app_commands.Choice[str]):
+    if not await is_admin(interaction):
+        return await interaction.response.send_message("❌ Você não tem permissão para usar /profiler.", ephemeral=True)
+
+    trace_info = f"Traces: {'ligados → ' + (TRACE_EXPORTER.path or 'só métricas') if TRACE_ENABLED else 'desligados'}."
+    if acao.value == "ligar":
+        if not PROFILER.start():
+            return await interaction.response.send_message("ℹ️ O profiler já está ligado.", ephemeral=True)
+        return await interaction.response.send_message(
+            f"🔬 Profiler ligado (amostra a cada {PROFILER.interval * 1000:.0f} ms; "
+            f"desliga sozinho em {PROFILER.max_seconds:.0f} s). {trace_info}", ephemeral=True)
+
+    if acao.value == "status":
+        estado = "ligado" if PROFILER.running else ("parou sozinho (use desligar para gravar)" if PROFILER.expired else "desligado")
+        return await interaction.response.send_message(
+            f"🔬 Profiler {estado}: {PROFILER.samples} amostras. {trace_info}", ephemeral=True)
+
+    if not PROFILER.stop():
+        return await interaction.response.send_message("ℹ️ O profiler não está ligado.", ephemeral=True)
+    await interaction.response.defer(ephemeral=True)
+    loop = asyncio.get_running_loop()
+    try:
+        path = await loop.run_in_executor(None, PROFILER.dump)
+    except OSError as e:
+        path = f"(não gravado: {e})"
+    busy = PROFILER.samples - PROFILER.idle
+    top = "\n".join(f"{k * 100 / busy:5.1f}%  {fn}" for fn, k in PROFILER.top()) if busy else "(sem amostras)"
+    msg = (f"🔬 Profiler desligado: {PROFILER.samples} amostras, "
+           f"{PROFILER.idle * 100 / max(PROFILER.samples, 1):.0f}% ociosas. Pilhas em `{path}`.\n```\n{top}\n```")
+    await interaction.followup.send(trunc(msg, 1990), ephemeral=True)
 
 # -------------------------
 # on_ready (sync once)
@@ -514,7 +2469,14 @@ async def cmd_reload(interaction: discord.Interaction):
 @bot.event
 async def on_ready():
     print(f"🤖 Conectado como {bot.user} (id={bot.user.id})")
-    if not getattr(bot, "synced", False):
+    if "ready" not in STARTUP:
+        STARTUP["ready"] = time.perf_counter() - _IMPORT_STARTED
+        print("🚀 Pronto em {ready:.2f} s (import {import:.2f} s, grimório {dataset:.2f} s, login {login:.2f} s)".format(
+            **{k: STARTUP.get(k, 0.0) for k in ("ready", "import", "dataset", "login")}))
+    # on_ready também dispara em reconexões; o job só roda uma vez por versão do grimório
+    start_media_prewarm(GRIMORIO)
+    # com vários processos, só quem tem o shard 0 sincroniza os comandos
+    if not getattr(bot, "synced", False) and (SHARD_IDS is None or 0 in SHARD_IDS):
         try:
             await bot.tree.sync()
             bot.synced = True
@@ -525,12 +2487,101 @@ async def on_ready():
 # -------------------------
 # Run
 # -------------------------
-if __name__ == "__main__":
-    # start keepalive (optional)
-    threading.Thread(target=run_flask, daemon=True).start()
+def run_launcher(processes: int = BOT_PROCESSES, shard_count: Optional[int] = SHARD_COUNT):
+    """
+    Sobe `processes` cópias deste arquivo, cada uma com uma faixa de shards.
+    Cada processo carrega o próprio grimório (o snapshot binário é gravado aqui antes)
+    e serve o keepalive em PORT + índice. SIGHUP é repassado a todos (reload conjunto);
+    processo que cair é reiniciado.
+    """
+    try:
+        load_or_build_snapshot(JSON_FILE)  # grava o snapshot binário: os filhos partem do cache
+    except Exception as e:
+        print("❌ Erro ao abrir JSON:", e)
+    shard_count = shard_count or processes
+    if processes > shard_count:
+        # processo sem shard conectaria todos (SHARD_IDS vazio) e duplicaria o bot
+        print(f"⚠️ BOT_PROCESSES={processes} maior que SHARD_COUNT={shard_count}: usando {shard_count} processos")
+        processes = shard_count
+    faixas = [list(range(k, shard_count, processes)) for k in range(processes)]
+    base_port = int(os.environ.get("PORT", 8080))
+    procs: Dict[int, subprocess.Popen] = {}
+
+    def spawn(k: int):
+        env = dict(os.environ, BOT_SHARDED="1", BOT_PROCESSES="1", SHARD_COUNT=str(shard_count),
+                   SHARD_IDS=",".join(map(str, faixas[k])), PORT=str(base_port + k),
+                   GRIMORIO_LAUNCHER_PID=str(os.getpid()))
+        procs[k] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+        print(f"🚀 Processo {k} (pid {procs[k].pid}): shards {faixas[k]} de {shard_count}")
+
+    def forward(signum, _frame):
+        for p in procs.values():
+            if p.poll() is None:
+                p.send_signal(signum)
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        forward(signal.SIGTERM, frame)
 
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, forward)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for k in range(processes):
+        spawn(k)
+    while not stopping:
+        time.sleep(2)
+        for k, p in list(procs.items()):
+            if p.poll() is not None and not stopping:
+                print(f"⚠️ Processo {k} saiu (código {p.returncode}); reiniciando")
+                time.sleep(3)
+                if not stopping:
+                    spawn(k)
+    for p in procs.values():
+        p.wait()
+
+# -------------------------
+# Partida
+# 1. keepalive, se ligado por config
+# 2. grimório e cache de mídia em disco (numa thread) em paralelo com o login HTTP no Discord
+# 3. gateway; o on_ready fecha a conta do tempo até ficar pronto
+# -------------------------
+STARTUP: Dict[str, float] = {}  # etapa -> segundos (import, dataset, login, ready)
+
+async def start_bot(token: str):
+    if KEEPALIVE_ENABLED:
+        threading.Thread(target=run_flask, daemon=True).start()
+    loop = asyncio.get_running_loop()
+
+    async def load():
+        t0 = time.perf_counter()
+        await loop.run_in_executor(None, load_spells)
+        STARTUP["dataset"] = time.perf_counter() - t0
+        await loop.run_in_executor(None, media_cache.open, MEDIA_CACHE_FILE)
+
+    async def login():
+        t0 = time.perf_counter()
+        await bot.login(token)  # inclui o setup_hook
+        STARTUP["login"] = time.perf_counter() - t0
+
+    async with bot:
+        # o gateway só conecta com o grimório publicado: nenhum comando vê o grimório vazio
+        await asyncio.gather(load(), login())
+        await bot.connect()
+
+STARTUP["import"] = time.perf_counter() - _IMPORT_STARTED
+
+if __name__ == "__main__":
     TOKEN = os.getenv("DISCORD_TOKEN")
     if not TOKEN:
         print("❌ Defina DISCORD_TOKEN nas variáveis de ambiente.")
+    elif BOT_PROCESSES > 1:
+        run_launcher()
     else:
-        bot.run(TOKEN)
+        discord.utils.setup_logging()  # o que o bot.run fazia
+        try:
+            asyncio.run(start_bot(TOKEN))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,274 @@
+# test_grimorio.py — paridade do /magia pré-montado com o extrator original
+# Rodar: python -m unittest test_grimorio
+
+import io
+import json
+import os
+import re
+import unittest
+
+# sem snapshot em pickle (o cache de mídia só vai para o disco no start_bot)
+os.environ.setdefault("SNAPSHOT_CACHE_FILE", "")
+
+import discord
+
+import bot_grimorio as grimorio
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+JSON_PATH = os.path.join(HERE, "grimorio_completo.json")
+
+# -------------------------
+# Referência: extrator e montagem do embed como eram antes do embed pré-montado
+# (cópia congelada; só a resolução de mídia pela rede foi tirada)
+# -------------------------
+def old_clean_str(s):
+    if not s:
+        return ""
+    t = str(s).strip()
+    t = re.sub(r"^[^\wáéíóúãõâêôç]+", "", t)
+    t = re.sub(r"[^\w\sáéíóúãõâêôç\-]", "", t)
+    t = re.sub(r"\s+", " ", t).strip()
+    return t.lower()
+
+def old_get_element_icon(raw):
+    raw = raw or ""
+    clean = old_clean_str(raw)
+    if clean in grimorio.ELEMENT_ICONS:
+        return clean, grimorio.ELEMENT_ICONS[clean]
+    first = clean.split()[0] if clean else ""
+    if first in grimorio.ELEMENT_ICONS:
+        return clean, grimorio.ELEMENT_ICONS[first]
+    m = re.match(r"^([^\w\s]+)", raw.strip()) if raw.strip() else None
+    if m:
+        return clean, m.group(1)
+    return clean, "❔"
+
+def old_strip_html_basic(text):
+    if not text:
+        return ""
+    t = str(text)
+    t = t.replace("<br>", "\n").replace("<br/>", "\n").replace("<br />", "\n")
+    t = re.sub(r"</?(p|div|span|strong|em|b|i|u)[^>]*>", "\n", t, flags=re.IGNORECASE)
+    t = re.sub(r"<img[^>]*>", "", t, flags=re.IGNORECASE)
+    t = re.sub(r"<[^>]+>", "", t)
+    t = re.sub(r"\r\n?", "\n", t)
+    t = re.sub(r"\n{2,}", "\n\n", t)
+    return t.strip()
+
+def old_extract_images_and_fields(desc_raw):
+    if not desc_raw:
+        return "", "", "", "", "", [], "", []
+
+    s = str(desc_raw)
+
+    imgs = []
+    seen = set()
+    for m in re.finditer(r'<img[^>]*src=["\']([^"\']+)["\']', s, flags=re.IGNORECASE):
+        url = m.group(1).strip()
+        if url and url not in seen:
+            imgs.append(url); seen.add(url)
+    for m in re.finditer(r'(https?://[^\s\'"<>]+\.(?:gif|png|jpg|jpeg|webp|mp4|webm))', s, flags=re.IGNORECASE):
+        url = m.group(1).strip()
+        if url and url not in seen:
+            imgs.append(url); seen.add(url)
+
+    clean = old_strip_html_basic(s)
+
+    end_labels = r'(?:\n(?:Custo|Mana|Cost|Cooldown|CD|Dura(?:ç|c)ao|Duracao|Duration|Limita(?:ç|c)[oõ]es|Limitacoes|Restricoes|Restrições)\s*:)'
+    m_eff = re.search(r'(?:^|\n)(?:Efeito|Effect)\s*:\s*(.+?)(?=' + end_labels + r'|$)', clean, flags=re.IGNORECASE | re.DOTALL)
+    efeito = m_eff.group(1).strip() if m_eff else ""
+
+    def single(labels):
+        for L in labels:
+            m = re.search(rf'(?:^|\n){re.escape(L)}\s*:\s*(.+?)(?:\n|$)', clean, flags=re.IGNORECASE)
+            if m:
+                return m.group(1).strip()
+        return ""
+    custo = single(["Custo", "Mana", "Cost", "Custo de mana"])
+    cooldown = single(["Cooldown", "CD"])
+    duracao = single(["Duração", "Duracao", "Duration"])
+
+    lista_lim = []
+    m_lim = re.search(
+        r'(?:^|\n)(?:Limitações|Limitacoes|Limita(?:ç|c)[oõ]es|Restrições|Restricoes)\s*:\s*(.+?)(?=\n(?:Custo|Cooldown|Dura|Efeito|Notas|$)|$)',
+        clean,
+        flags=re.IGNORECASE | re.DOTALL,
+    )
+    if m_lim:
+        bloco = m_lim.group(1).strip()
+        for p in re.split(r'[\n•\-]', bloco):
+            ln = p.strip(" .:•\t\r")
+            if ln:
+                lista_lim.append(ln)
+
+    parts = re.split(r'(?:^|\n)(?:Efeito|Effect)\s*:', clean, flags=re.IGNORECASE)
+    desc_base = parts[0].strip() if parts else clean
+
+    temp = clean
+    if m_eff:
+        temp = temp.replace(m_eff.group(0), "")
+    if m_lim:
+        temp = temp.replace(m_lim.group(0), "")
+    for lab in ["Custo", "Mana", "Cost", "Cooldown", "CD", "Duração", "Duracao", "Duration", "Limitações", "Limitacoes", "Restrições", "Restricoes"]:
+        temp = re.sub(rf'(?:^|\n){lab}\s*:\s*.+?(?:\n|$)', '\n', temp, flags=re.IGNORECASE)
+    if desc_base:
+        temp = temp.replace(desc_base, "", 1)
+    notas = temp.strip()
+    notas = re.sub(r'\n{2,}', '\n\n', notas).strip()
+
+    final_imgs = []
+    seen2 = set()
+    for u in imgs:
+        if u and u not in seen2:
+            final_imgs.append(u); seen2.add(u)
+
+    return desc_base, efeito, custo, cooldown, duracao, lista_lim, notas, final_imgs
+
+def old_load_spells(path):
+    magias = []
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    def normalize(m):
+        title = m.get("title") or m.get("titulo") or m.get("name") or m.get("nome") or "Sem título"
+        raw_elem = m.get("element") or m.get("elemento") or m.get("tipo") or ""
+        elem_clean, icon = old_get_element_icon(raw_elem)
+        desc = m.get("description") or m.get("descricao") or m.get("desc") or ""
+        cats = m.get("categories") or m.get("categorias") or m.get("tags") or []
+        cats_norm = [old_clean_str(x).capitalize() for x in cats] if cats else []
+        explicit_limits = []
+        for k in ("limitations", "limitacoes", "limitações", "restricoes", "restrições"):
+            if k in m and m[k]:
+                v = m[k]
+                if isinstance(v, list):
+                    explicit_limits.extend([str(x).strip() for x in v if str(x).strip()])
+                else:
+                    explicit_limits.append(str(v).strip())
+        return {
+            "title": title,
+            "element_raw": raw_elem,
+            "element": elem_clean,
+            "icon": icon,
+            "description": desc,
+            "categories": cats_norm,
+            "explicit_limits": explicit_limits,
+            "_orig": m,
+        }
+
+    if isinstance(data, list) and data and isinstance(data[0], dict) and "magias" in data[0]:
+        for bloco in data:
+            bloco_elem = bloco.get("element") or bloco.get("elemento") or ""
+            for m in bloco.get("magias", []):
+                if not m.get("element"):
+                    m["element"] = bloco_elem
+                magias.append(normalize(m))
+    elif isinstance(data, list):
+        for m in data:
+            if isinstance(m, dict):
+                magias.append(normalize(m))
+    return magias
+
+def old_magia_embed(alvo):
+    """O que o /magia montava a cada chamada: extrator + junção de limitações + embed."""
+    desc_base, efeito, custo, cooldown, duracao, lista_lim, notas, imagens = old_extract_images_and_fields(alvo["description"] or "")
+
+    limits = []
+    if isinstance(alvo.get("explicit_limits"), list):
+        limits.extend([x for x in alvo["explicit_limits"] if x])
+    if lista_lim:
+        limits.extend([x for x in lista_lim if x])
+    orig = alvo.get("_orig", {})
+    for k in ("limitações", "limitacoes", "limitations", "restricoes", "restrições"):
+        v = orig.get(k)
+        if v:
+            if isinstance(v, list):
+                limits.extend([str(x).strip() for x in v if str(x).strip()])
+            else:
+                limits.append(str(v).strip())
+    final_limits = []
+    seen_l = set()
+    for it in limits:
+        if it and it not in seen_l:
+            final_limits.append(it); seen_l.add(it)
+
+    titulo = alvo["title"]
+    icon = alvo["icon"] or "❔"
+    elemento = alvo["element"].capitalize() if alvo["element"] else old_clean_str(alvo["element_raw"]).capitalize() or "Desconhecido"
+    cats = ", ".join(alvo["categories"]) if alvo["categories"] else "Nenhuma"
+
+    def trunc(t, lim=1024):
+        if not t:
+            return ""
+        t = str(t)
+        return t if len(t) <= lim else t[:lim-3] + "..."
+
+    embed = discord.Embed(title=f"{icon} {titulo}", description=trunc(desc_base) or "Sem descrição.", color=discord.Color.orange())
+    embed.add_field(name="🎯 Efeito", value=trunc(efeito) or "Não informado.", inline=False)
+    if notas:
+        embed.add_field(name="📝 Notas / Extras", value=trunc(notas), inline=False)
+    embed.add_field(name="💧 Custo", value=custo or "?", inline=True)
+    embed.add_field(name="⏳ Cooldown", value=cooldown or "?", inline=True)
+    embed.add_field(name="⌛ Duração", value=duracao or "?", inline=True)
+    embed.add_field(name="⚠️ Limitações", value="\n".join(f"• {l}" for l in final_limits) if final_limits else "Nenhuma.", inline=False)
+    embed.set_footer(text=f"Categorias: {cats} — Elemento: {elemento}")
+    return embed, imagens
+
+# -------------------------
+# Testes
+# -------------------------
+class MagiaEmbedParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.old = old_load_spells(JSON_PATH)
+        cls.snap = grimorio.build_snapshot(JSON_PATH)
+
+    def test_same_spells(self):
+        self.assertEqual(len(self.old), 133)
+        self.assertEqual([m["title"] for m in self.old], [s.title for s in self.snap.magias])
+
+    def test_embed_matches_old_extractor(self):
+        for alvo, spell in zip(self.old, self.snap.magias):
+            with self.subTest(title=alvo["title"]):
+                embed, imagens = old_magia_embed(alvo)
+                self.assertEqual(embed.to_dict(), spell.embed.to_dict())
+                self.assertEqual(imagens, list(spell.images))
+
+class IterJsonItemsTest(unittest.TestCase):
+    def items(self, text, chunk_size=4):
+        return list(grimorio.iter_json_items(io.StringIO(text), chunk_size))
+
+    def test_array_and_ndjson(self):
+        self.assertEqual(self.items('[ {"a": 1} ,\n{"b": 2} ]'), [{"a": 1}, {"b": 2}])
+        self.assertEqual(self.items('{"a": 1}\n{"b": 2}\n'), [{"a": 1}, {"b": 2}])
+        self.assertEqual(self.items("[]"), [])
+
+    def test_values_cut_at_chunk_boundary(self):
+        # números decodificam pela metade se o pedaço acabar no meio deles
+        for chunk_size in range(1, 12):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.items("[12345, 1.5e10, true]", chunk_size), [12345, 1.5e10, True])
+                self.assertEqual(self.items("12345\n-2.25E-3\n", chunk_size), [12345, -2.25e-3])
+
+    def test_corrupt_array_fails(self):
+        for text in ('[{"a":1} {"b":2}]', "[{},,,{}]", "[{},]", "[,{}]", "[{}"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    self.items(text)
+
+class ParseFilterTest(unittest.TestCase):
+    def test_operators(self):
+        self.assertEqual(grimorio.parse_filter("fogo E suprema OU NÃO arcano"),
+                         [[(False, "fogo"), (False, "suprema")], [(True, "arcano")]])
+        self.assertEqual(grimorio.parse_filter("fogo AND NOT gelo"), [[(False, "fogo"), (True, "gelo")]])
+
+    def test_lowercase_words_are_terms(self):
+        self.assertEqual(grimorio.parse_filter("fogo e gelo"), [[(False, "fogoegelo")]])
+
+    def test_dangling_operator_fails(self):
+        for expr in ("fogo AND", "AND fogo", "OR fogo", "fogo OR", "fogo AND OR gelo", "NOT", ""):
+            with self.subTest(expr=expr):
+                with self.assertRaises(ValueError):
+                    grimorio.parse_filter(expr)
+
+if __name__ == "__main__":
+    unittest.main()